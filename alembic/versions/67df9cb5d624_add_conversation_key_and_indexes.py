@@ -0,0 +1,45 @@
+"""Add conversation key and access path indexes
+
+Revision ID: 67df9cb5d624
+Revises: 89c47063137e
+Create Date: 2026-10-17 10:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '67df9cb5d624'
+down_revision: Union[str, None] = '89c47063137e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('conversation_key', sa.String(), nullable=True))
+    op.execute(
+        "UPDATE messages "
+        "SET conversation_key = LEAST(sender_id, recipient_user_id) || ':' || GREATEST(sender_id, recipient_user_id) "
+        "WHERE recipient_user_id IS NOT NULL"
+    )
+
+    # CREATE INDEX CONCURRENTLY can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_conversation_key_created_at_id', 'messages', ['conversation_key', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_messages_sender_id_recipient_user_id_created_at', 'messages', ['sender_id', 'recipient_user_id', 'created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_friend_requests_requester_id_status', 'friend_requests', ['requester_id', 'status'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_friend_requests_recipient_id_status', 'friend_requests', ['recipient_id', 'status'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_friend_requests_recipient_id_status', table_name='friend_requests', postgresql_concurrently=True)
+        op.drop_index('ix_friend_requests_requester_id_status', table_name='friend_requests', postgresql_concurrently=True)
+        op.drop_index('ix_messages_sender_id_recipient_user_id_created_at', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('ix_messages_conversation_key_created_at_id', table_name='messages', postgresql_concurrently=True)
+    op.drop_column('messages', 'conversation_key')
@@ -0,0 +1,36 @@
+"""Add group read cursors and group message indexes
+
+Revision ID: 9a3d5f7c2e18
+Revises: 5e8b0f1d7a36
+Create Date: 2026-10-17 18:02:44.531706
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3d5f7c2e18'
+down_revision: Union[str, None] = '5e8b0f1d7a36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('group_members', sa.Column('last_read_message_id', sa.Integer(), server_default='0', nullable=False))
+
+    # CREATE INDEX CONCURRENTLY can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_recipient_group_id_id', 'messages', ['recipient_group_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_group_members_user_id', 'group_members', ['user_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_group_members_user_id', table_name='group_members', postgresql_concurrently=True)
+        op.drop_index('ix_messages_recipient_group_id_id', table_name='messages', postgresql_concurrently=True)
+    op.drop_column('group_members', 'last_read_message_id')
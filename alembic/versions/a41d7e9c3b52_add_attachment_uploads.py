@@ -0,0 +1,41 @@
+"""Add attachment uploads
+
+Revision ID: a41d7e9c3b52
+Revises: f3b7c0d94a21
+Create Date: 2026-10-18 10:12:47.305816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d7e9c3b52'
+down_revision: Union[str, None] = 'f3b7c0d94a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('attachment_uploads',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['sha256'], ['attachment_blobs.sha256'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sha256', 'user_id')
+    )
+    # the first uploaders were the only ones recorded so far
+    op.execute(
+        "INSERT INTO attachment_uploads (sha256, user_id, created_at, updated_at) "
+        "SELECT sha256, created_by, created_at, updated_at FROM attachment_blobs WHERE created_by IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('attachment_uploads')
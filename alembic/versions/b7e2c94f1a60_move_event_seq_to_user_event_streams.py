@@ -0,0 +1,37 @@
+"""Move the user event seq counter to user_event_streams
+
+Revision ID: b7e2c94f1a60
+Revises: a41d7e9c3b52
+Create Date: 2026-10-18 11:03:29.517204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c94f1a60'
+down_revision: Union[str, None] = 'a41d7e9c3b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_event_streams',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_seq', sa.BigInteger(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute("INSERT INTO user_event_streams (user_id, last_seq) SELECT id, last_event_seq FROM users WHERE last_event_seq > 0")
+    op.drop_column('users', 'last_event_seq')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('users', sa.Column('last_event_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute("UPDATE users SET last_event_seq = user_event_streams.last_seq FROM user_event_streams WHERE user_event_streams.user_id = users.id")
+    op.drop_table('user_event_streams')
@@ -0,0 +1,37 @@
+"""Add trigram and full text search indexes
+
+Revision ID: b7e2d4c81f09
+Revises: 3c1f0e9a7b52
+Create Date: 2026-10-17 13:05:52.260771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d4c81f09'
+down_revision: Union[str, None] = '3c1f0e9a7b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CREATE INDEX CONCURRENTLY can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_email_trgm', 'users', ['email'], unique=False, postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_users_display_name_trgm', 'users', ['display_name'], unique=False, postgresql_using='gin', postgresql_ops={'display_name': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_messages_text_search', 'messages', [sa.text("to_tsvector('simple', coalesce(text, ''))")], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_text_search', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('ix_users_display_name_trgm', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_email_trgm', table_name='users', postgresql_concurrently=True)
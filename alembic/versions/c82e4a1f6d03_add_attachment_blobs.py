@@ -0,0 +1,45 @@
+"""Add attachment blobs
+
+Revision ID: c82e4a1f6d03
+Revises: 9a3d5f7c2e18
+Create Date: 2026-10-17 19:26:10.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c82e4a1f6d03'
+down_revision: Union[str, None] = '9a3d5f7c2e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('attachment_blobs',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('content_type', sa.String(), nullable=False),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('message_attachments', sa.Column('sha256', sa.String(), nullable=True))
+    op.create_foreign_key('message_attachments_sha256_fkey', 'message_attachments', 'attachment_blobs', ['sha256'], ['sha256'])
+    op.create_index('ix_message_attachments_message_id', 'message_attachments', ['message_id'], unique=False)
+    op.create_index('ix_message_attachments_sha256', 'message_attachments', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_message_attachments_sha256', table_name='message_attachments')
+    op.drop_index('ix_message_attachments_message_id', table_name='message_attachments')
+    op.drop_constraint('message_attachments_sha256_fkey', 'message_attachments', type_='foreignkey')
+    op.drop_column('message_attachments', 'sha256')
+    op.drop_table('attachment_blobs')
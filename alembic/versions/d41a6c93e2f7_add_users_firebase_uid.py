@@ -0,0 +1,35 @@
+"""Add firebase uid to users
+
+Revision ID: d41a6c93e2f7
+Revises: b7e2d4c81f09
+Create Date: 2026-10-17 15:21:08.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a6c93e2f7'
+down_revision: Union[str, None] = 'b7e2d4c81f09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # filled by `python -m utils.psql.identity backfill`, and on each user's first request
+    op.add_column('users', sa.Column('firebase_uid', sa.String(), nullable=True))
+
+    # CREATE INDEX CONCURRENTLY can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_firebase_uid', 'users', ['firebase_uid'], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_firebase_uid', table_name='users', postgresql_concurrently=True)
+    op.drop_column('users', 'firebase_uid')
@@ -0,0 +1,28 @@
+"""Add a dispatch lease to user event streams
+
+Revision ID: d95a3f6e0b17
+Revises: b7e2c94f1a60
+Create Date: 2026-10-18 11:48:02.643190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd95a3f6e0b17'
+down_revision: Union[str, None] = 'b7e2c94f1a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_event_streams', sa.Column('dispatch_lease_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_event_streams', 'dispatch_lease_until')
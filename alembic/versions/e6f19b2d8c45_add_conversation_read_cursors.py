@@ -0,0 +1,30 @@
+"""Add conversation read cursors
+
+Revision ID: e6f19b2d8c45
+Revises: c82e4a1f6d03
+Create Date: 2026-10-17 20:41:52.604913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6f19b2d8c45'
+down_revision: Union[str, None] = 'c82e4a1f6d03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('last_read_low_id', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('conversations', sa.Column('last_read_high_id', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'last_read_high_id')
+    op.drop_column('conversations', 'last_read_low_id')
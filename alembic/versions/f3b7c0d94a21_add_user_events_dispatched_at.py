@@ -0,0 +1,32 @@
+"""Add dispatched_at to user events for the outbox
+
+Revision ID: f3b7c0d94a21
+Revises: e6f19b2d8c45
+Create Date: 2026-10-17 21:37:05.772941
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b7c0d94a21'
+down_revision: Union[str, None] = 'e6f19b2d8c45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_events', sa.Column('dispatched_at', sa.DateTime(), nullable=True))
+    # events recorded before the outbox were already pushed inline
+    op.execute(sa.text('UPDATE user_events SET dispatched_at = created_at'))
+    op.create_index('ix_user_events_undispatched', 'user_events', ['id'], unique=False, postgresql_where=sa.text('dispatched_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_events_undispatched', table_name='user_events', postgresql_where=sa.text('dispatched_at IS NULL'))
+    op.drop_column('user_events', 'dispatched_at')
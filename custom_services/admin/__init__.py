@@ -1,15 +1,16 @@
 from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import and_, or_
-from sqlalchemy.orm import joinedload, aliased
+from sqlalchemy import and_, or_, select
 from firebase_admin import auth
 
-from custom_services.social_actions.schemas import UserOut
-from utils.functions import paginate_data
+from utils.functions import paginate_data, paginate_request, paginated_response
 
-from .schemas import AdminUserModel, FriendRequestModel, FriendRequestUser, GetAllUsersRequest, GetAllUsersResponse, GetContextUsersRequest, GetContextUsersResponse, GetFriendsRequest, GetFriendsResponse, GetLoginTokenRequest, GetLoginTokenResponse, GetMessagesRequest, GetMessagesResponse, MessageModel, MessageUser, SetFriendRequestRequest, SetFriendRequestResponse
+from .schemas import FriendRequestModel, FriendRequestUser, GetAllUsersRequest, GetAllUsersResponse, GetContextUsersRequest, GetContextUsersResponse, GetFriendsRequest, GetFriendsResponse, GetLoginTokenRequest, GetLoginTokenResponse, GetMessagesRequest, GetMessagesResponse, MessageModel, MessageUser, SetFriendRequestRequest, SetFriendRequestResponse
 from .utils import check_admin_user
-from utils.dependencies import user_verify_dependency, psql_dependency, firestore_dependency
+from custom_services.social_actions.utils import annotate_friend_status
+from utils.dependencies import user_verify_dependency, async_psql_dependency, firestore_dependency, user_loader_dependency
+from utils.psql.friends import friend_graph_cache
 from utils.psql.models import FriendRequest, User, Message
+from utils.psql.search import get_dialect_name, user_search_filter, user_search_rank
 
 admin_router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -35,50 +36,35 @@ async def get_login_token(request: GetLoginTokenRequest, admin_user=user_verify_
 
 
 @admin_router.post("/get_all_users", response_model=GetAllUsersResponse)
-async def get_all_users(request: GetAllUsersRequest, user=user_verify_dependency, psql_db=psql_dependency):
+async def get_all_users(request: GetAllUsersRequest, user=user_verify_dependency, psql_db=async_psql_dependency):
     check_admin_user(user["email"])
 
     q = request.q
-    limit = request.limit
-    offset = request.offset
 
-    users_query = psql_db.query(User)
+    users_query = select(User.email, User.display_name, User.phone)
 
     if q:
+        if request.cursor:
+            raise HTTPException(status_code=400, detail="Search results are paginated with offset")
+        dialect_name = get_dialect_name(psql_db)
         users_query = users_query.where(
-            or_(
-                User.email.ilike(f"%{q}%"),
-                User.display_name.ilike(f"%{q}%")
-            )
-        )
-
-    total = users_query.count()
+            user_search_filter(dialect_name, q)
+        ).order_by(user_search_rank(dialect_name, q).desc(), User.email.asc())
+        users, next_offset, total = await paginate_data(psql_db, users_query, request.limit, request.offset)
+        page = {"next_offset": next_offset, "next_cursor": None, "total": total}
+    else:
+        users, page = await paginate_request(psql_db, users_query, request, keys=[User.email])
 
-    users_query = users_query.offset(offset).limit(limit)
-
-    users = users_query.all()
-
-    next_offset = offset + limit if offset + limit < total else None
-
-    return GetAllUsersResponse(
-        data=[
-            AdminUserModel(**user.__dict__)    
-            for user in users
-        ],
-        next_offset=next_offset,
-        total=total
-    )
+    return paginated_response(GetAllUsersResponse, users, **page)
 
 @admin_router.post("/get_friends", response_model=GetFriendsResponse)
-async def get_friends(request: GetFriendsRequest, admin_user=user_verify_dependency, psql_db=psql_dependency):
+async def get_friends(request: GetFriendsRequest, admin_user=user_verify_dependency, psql_db=async_psql_dependency, user_loader=user_loader_dependency):
     check_admin_user(admin_user["email"])
 
     email=request.email
     q=request.q
-    limit=request.limit
-    offset=request.offset
 
-    user = psql_db.query(User).where(User.email.__eq__(email)).first()
+    user = await psql_db.scalar(select(User).where(User.email.__eq__(email)))
 
     if not user:
         return HTTPException(
@@ -88,125 +74,89 @@ async def get_friends(request: GetFriendsRequest, admin_user=user_verify_depende
     
     user_id = user.id
 
-    query = psql_db.query(FriendRequest).where(
+    # only the columns the response needs, the users come from the loader
+    query = select(
+        FriendRequest.id, FriendRequest.requester_id, FriendRequest.recipient_id, FriendRequest.status
+    ).where(
         or_(
             FriendRequest.recipient_id.__eq__(user_id),
             FriendRequest.requester_id.__eq__(user_id)
         )
-    ).options(
-        joinedload(FriendRequest.recipient),
-        joinedload(FriendRequest.requester)
     )
 
     if q:
-        ilike_pattern = f"%{q}%"
+        dialect_name = get_dialect_name(psql_db)
         query = query.filter(
             or_(
-                FriendRequest.recipient.has(
-                    or_(
-                        User.email.ilike(ilike_pattern),
-                        User.display_name.ilike(ilike_pattern),
-                    )
-                ),
-                FriendRequest.requester.has(
-                    or_(
-                        User.email.ilike(ilike_pattern),
-                        User.display_name.ilike(ilike_pattern),
-                    )
-                ),
+                FriendRequest.recipient.has(user_search_filter(dialect_name, q)),
+                FriendRequest.requester.has(user_search_filter(dialect_name, q)),
             )
         )
 
-    data, next_offset, total = paginate_data(query, limit, offset)
+    data, page = await paginate_request(psql_db, query, request, keys=[FriendRequest.id])
+    users = await user_loader.load_many([user_id for item in data for user_id in (item.requester_id, item.recipient_id)])
 
-    return GetFriendsResponse(
-        data=[
+    return paginated_response(
+        GetFriendsResponse,
+        [
             FriendRequestModel(
                 recipient=FriendRequestUser(
-                    email=item.recipient.email,
-                    display_name=item.recipient.display_name
+                    email=users[item.recipient_id].email,
+                    display_name=users[item.recipient_id].display_name
                 ),
                 requester=FriendRequestUser(
-                    email=item.requester.email,
-                    display_name=item.requester.display_name
+                    email=users[item.requester_id].email,
+                    display_name=users[item.requester_id].display_name
                 ),
                 status=item.status
             )
             for item in data
         ],
-        next_offset=next_offset,
-        total=total
+        **page
     )
 
 
 @admin_router.post("/search_context_users", response_model=GetContextUsersResponse)
-async def search_context_users(request: GetContextUsersRequest, admin_user=user_verify_dependency, psql_db=psql_dependency):
-    check_admin_user(admin_user["user"])
+async def search_context_users(request: GetContextUsersRequest, admin_user=user_verify_dependency, psql_db=async_psql_dependency):
+    check_admin_user(admin_user["email"])
 
     email = request.context_email
     q = request.q
-    limit = request.limit
-    offset = request.offset
 
-    current_user: User = psql_db.query(User).filter(User.email == email).first()
+    current_user: User = await psql_db.scalar(select(User).filter(User.email == email))
     if not current_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Aliased FriendRequest to allow outer join in both directions
-    FriendRequestAlias = aliased(FriendRequest)
-
-    # Join FriendRequest (in either direction) to get status if exists
-    users_query = (
-        psql_db.query(User, FriendRequestAlias.status.label("friend_status"))
-        .outerjoin(
-            FriendRequestAlias,
-            or_(
-                and_(
-                    FriendRequestAlias.requester_id == current_user.id,
-                    FriendRequestAlias.recipient_id == User.id,
-                ),
-                and_(
-                    FriendRequestAlias.recipient_id == current_user.id,
-                    FriendRequestAlias.requester_id == User.id,
-                ),
-            ),
-        )
-        .filter(User.id != current_user.id)
-    )
+    # friend status comes from the cached friend graph of the context user
+    users_query = select(User.id, User.email, User.display_name, User.phone).filter(User.id != current_user.id)
 
     if q:
+        if request.cursor:
+            raise HTTPException(status_code=400, detail="Search results are paginated with offset")
+        dialect_name = get_dialect_name(psql_db)
         users_query = users_query.filter(
-            or_(
-                User.email.ilike(f"%{q}%"),
-                User.display_name.ilike(f"%{q}%"),
-            )
-        )
-
-    users_query = users_query.order_by(User.email.asc())
+            user_search_filter(dialect_name, q)
+        ).order_by(user_search_rank(dialect_name, q).desc(), User.email.asc())
+        users_data, next_offset, total = await paginate_data(psql_db, users_query, request.limit, request.offset)
+        page = {"next_offset": next_offset, "next_cursor": None, "total": total}
+    else:
+        users_data, page = await paginate_request(psql_db, users_query, request, keys=[User.email])
+    edges = await friend_graph_cache.get(psql_db, current_user.id)
 
-    users_data, next_offset, total = paginate_data(users_query, limit, offset)
-
-    return GetContextUsersResponse(
-        data=[
-            UserOut(**user.__dict__, friend_status=friend_status)
-            for user, friend_status in users_data
-        ],
-        next_offset=next_offset,
-        total=total
-    )
+    return paginated_response(GetContextUsersResponse, annotate_friend_status(users_data, edges), **page)
 
 
 
 @admin_router.post("/set_friend_request" ,response_model=SetFriendRequestResponse)
-async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_verify_dependency, psql_db=psql_dependency):
+async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_verify_dependency, psql_db=async_psql_dependency):
     check_admin_user(admin_user["email"])
 
     requester_email = request.requester_email
     recipient_email = request.recipient_email
     friend_status = request.status
 
-    requester = psql_db.query(User).where(User.email.__eq__(requester_email)).first()
-    recipient = psql_db.query(User).where(User.email.__eq__(recipient_email)).first()
+    requester = await psql_db.scalar(select(User).where(User.email.__eq__(requester_email)))
+    recipient = await psql_db.scalar(select(User).where(User.email.__eq__(recipient_email)))
 
     if not requester or not recipient:
         return HTTPException(
@@ -217,7 +167,7 @@ async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_v
     requester_id = requester.id
     recipient_id = recipient.id
 
-    friend_request = psql_db.query(FriendRequest).where(
+    friend_request = await psql_db.scalar(select(FriendRequest).where(
         or_(
             and_(
                 FriendRequest.recipient_id.__eq__(recipient_id),
@@ -228,7 +178,7 @@ async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_v
                 FriendRequest.requester_id.__eq__(recipient_id)
             )
         )
-    ).first()
+    ))
 
     if not friend_request:
         friend_request = FriendRequest(
@@ -236,11 +186,11 @@ async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_v
             requester_id=requester_id
         )
     
-    friend_request.status = friend_status
+    friend_request.status = friend_status.value
 
     psql_db.add(friend_request)
-    psql_db.commit()
-    psql_db.refresh(friend_request)
+    await psql_db.commit()
+    friend_graph_cache.invalidate(requester_id, recipient_id)
 
     return SetFriendRequestResponse(
         success=True,
@@ -249,16 +199,14 @@ async def set_friend_request(request: SetFriendRequestRequest, admin_user=user_v
 
 
 @admin_router.post("/get_messages", response_model=GetMessagesResponse)
-async def get_messages(request: GetMessagesRequest, admin_user=user_verify_dependency, psql_db=psql_dependency):
+async def get_messages(request: GetMessagesRequest, admin_user=user_verify_dependency, psql_db=async_psql_dependency, user_loader=user_loader_dependency):
     check_admin_user(admin_user["email"])
 
     sender_email = request.sender_email
     recipient_email = request.recipient_email
-    limit = request.limit
-    offset = request.offset
 
-    sender = psql_db.query(User).where(User.email.__eq__(sender_email)).first()
-    recipient = psql_db.query(User).where(User.email.__eq__(recipient_email)).first() if recipient_email else None
+    sender = await psql_db.scalar(select(User).where(User.email.__eq__(sender_email)))
+    recipient = await psql_db.scalar(select(User).where(User.email.__eq__(recipient_email))) if recipient_email else None
 
     if not sender:
         return HTTPException(
@@ -274,28 +222,29 @@ async def get_messages(request: GetMessagesRequest, admin_user=user_verify_depen
         Message.recipient_user_id.__eq__(recipient_id)
     )
     
-    query = psql_db.query(Message).where(id_query).options(
-        joinedload(Message.sender),
-        joinedload(Message.recipient_user)
+    # direct messages only, group messages have no recipient user
+    query = select(Message.id, Message.text, Message.sender_id, Message.recipient_user_id).where(
+        id_query, Message.recipient_user_id.is_not(None)
     )
 
-    data, next_offset, total = paginate_data(query, limit, offset)
+    data, page = await paginate_request(psql_db, query, request, keys=[Message.id])
+    users = await user_loader.load_many([user_id for item in data for user_id in (item.sender_id, item.recipient_user_id)])
 
-    return GetMessagesResponse(
-        data=[
+    return paginated_response(
+        GetMessagesResponse,
+        [
             MessageModel(
                 text=item.text,
                 sender=MessageUser(
-                    email=item.sender.email,
-                    display_name=item.sender.display_name
+                    email=users[item.sender_id].email,
+                    display_name=users[item.sender_id].display_name
                 ),
                 recipient=MessageUser(
-                    email=item.recipient_user.email,
-                    display_name=item.recipient_user.display_name
+                    email=users[item.recipient_user_id].email,
+                    display_name=users[item.recipient_user_id].display_name
                 )
             )
             for item in data
         ],
-        next_offset=next_offset,
-        total=total
+        **page
     )
@@ -0,0 +1,159 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from utils.psql import get_insert
+from utils.psql.models import AttachmentBlob, AttachmentUpload
+from utils.psql.search import get_dialect_name
+from utils.storage import ObjectTooLarge, object_store
+from .schemas import AttachmentModel, AttachmentUploadResponse
+from .utils import ATTACHMENT_MAX_SIZE, THUMBNAIL_SIZES, attachment_url, blob_key, derivation_cache, get_readable_blob, make_thumbnail, make_waveform, parse_range, served_content_type
+from utils.dependencies import current_user_dependency, async_psql_dependency
+
+attachments_router = APIRouter(prefix="/attachments", tags=["Attachments"])
+
+sha256_path = Path(pattern="^[0-9a-f]{64}$")
+# content never changes under a hash, clients can cache it for good
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+async def get_readable_blob_or_raise(psql_db, current_user, sha256: str) -> AttachmentBlob:
+    blob = await get_readable_blob(psql_db, current_user, sha256) if current_user else None
+    if blob is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Attachment not found"
+        )
+    return blob
+
+
+@attachments_router.post("/upload", response_model=AttachmentUploadResponse)
+async def upload_attachment(request: Request, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    """
+    Raw request body upload, streamed to the object store while it is hashed.
+    Send the returned sha256 in send_message's attachments.
+    """
+    if not current_user:
+        return AttachmentUploadResponse(success=False, message="User is not available")
+    if int(request.headers.get("content-length") or 0) > ATTACHMENT_MAX_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment too large")
+
+    try:
+        staged = await object_store.stage(request.stream(), max_size=ATTACHMENT_MAX_SIZE)
+    except ObjectTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Attachment too large")
+    if not staged.size:
+        await object_store.discard(staged)
+        return AttachmentUploadResponse(success=False, message="Attachment is empty")
+
+    # identical content is stored once, the second upload only drops its staged copy
+    stored = await object_store.commit(staged, blob_key(staged.sha256))
+    await psql_db.execute(
+        get_insert(get_dialect_name(psql_db))(AttachmentBlob)
+        .values(
+            sha256=staged.sha256,
+            size=staged.size,
+            content_type=request.headers.get("content-type") or "application/octet-stream",
+            created_by=current_user.id,
+        )
+        .on_conflict_do_nothing(index_elements=[AttachmentBlob.sha256])
+    )
+    # the first upload's type is the one kept and served
+    content_type = await psql_db.scalar(
+        select(AttachmentBlob.content_type).where(AttachmentBlob.sha256.__eq__(staged.sha256))
+    )
+    # every uploader of identical content gets read access, not only the first one
+    await psql_db.execute(
+        get_insert(get_dialect_name(psql_db))(AttachmentUpload)
+        .values(sha256=staged.sha256, user_id=current_user.id)
+        .on_conflict_do_nothing(index_elements=[AttachmentUpload.sha256, AttachmentUpload.user_id])
+    )
+    await psql_db.commit()
+
+    return AttachmentUploadResponse(
+        success=True,
+        message="Attachment uploaded" if stored else "Attachment already uploaded",
+        attachment=AttachmentModel(
+            sha256=staged.sha256,
+            size=staged.size,
+            content_type=content_type,
+            file_url=attachment_url(staged.sha256),
+        ),
+    )
+
+
+@attachments_router.get("/{sha256}")
+async def download_attachment(
+    sha256: str = sha256_path,
+    range_header: Optional[str] = Header(default=None, alias="range"),
+    if_none_match: Optional[str] = Header(default=None),
+    current_user=current_user_dependency,
+    psql_db=async_psql_dependency,
+):
+    blob = await get_readable_blob_or_raise(psql_db, current_user, sha256)
+
+    headers = {
+        "ETag": f'"{sha256}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "X-Content-Type-Options": "nosniff",
+    }
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = parse_range(range_header, blob.size)
+    start, end = byte_range or (0, blob.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+
+    return StreamingResponse(
+        object_store.read(blob_key(sha256), start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=served_content_type(blob.content_type),
+        headers=headers,
+    )
+
+
+@attachments_router.get("/{sha256}/thumbnail")
+async def attachment_thumbnail(
+    sha256: str = sha256_path,
+    size: int = Query(default=256),
+    current_user=current_user_dependency,
+    psql_db=async_psql_dependency,
+):
+    blob = await get_readable_blob_or_raise(psql_db, current_user, sha256)
+    if size not in THUMBNAIL_SIZES or not blob.content_type.startswith("image/"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Thumbnails are only made for images, in sizes {THUMBNAIL_SIZES}")
+
+    try:
+        data = await derivation_cache.get(
+            f"derived/{sha256}/thumbnail-{size}.webp",
+            lambda: make_thumbnail(object_store, blob_key(sha256), size),
+        )
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image")
+
+    return Response(content=data, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+
+@attachments_router.get("/{sha256}/waveform")
+async def attachment_waveform(
+    sha256: str = sha256_path,
+    points: int = Query(default=100, ge=10, le=1000),
+    current_user=current_user_dependency,
+    psql_db=async_psql_dependency,
+):
+    # served as stored, the cached bytes are already the WaveformModel JSON
+    await get_readable_blob_or_raise(psql_db, current_user, sha256)
+
+    try:
+        data = await derivation_cache.get(
+            f"derived/{sha256}/waveform-{points}.json",
+            lambda: make_waveform(object_store, blob_key(sha256), points),
+        )
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Waveforms are only made for PCM WAV audio")
+
+    return Response(content=data, media_type="application/json", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
@@ -0,0 +1,14 @@
+from typing import Optional
+from pydantic import BaseModel
+
+from utils.models import BaseResponseModel
+
+class AttachmentModel(BaseModel):
+    sha256: str
+    size: int
+    content_type: str
+    file_url: str
+
+class AttachmentUploadResponse(BaseResponseModel):
+    attachment: Optional[AttachmentModel] = None
+
@@ -0,0 +1,183 @@
+import array
+import asyncio
+import io
+import json
+import os
+import threading
+import wave
+from typing import Callable, Optional
+from cachetools import LRUCache
+from fastapi import HTTPException, status
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from utils.psql.identity import UserIdentity
+from utils.psql.models import AttachmentBlob, AttachmentUpload, Message, MessageAttachment
+from utils.storage import ObjectStore, object_store
+
+ATTACHMENT_MAX_SIZE = int(os.getenv("ATTACHMENT_MAX_SIZE", str(100 * 1024 * 1024)))
+# in-process cache of derived thumbnails and waveforms, in bytes. They are also kept in the object store
+ATTACHMENT_DERIVATION_CACHE_BYTES = int(os.getenv("ATTACHMENT_DERIVATION_CACHE_BYTES", str(32 * 1024 * 1024)))
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+# served under their own type, anything else is a download. The type is the uploader's claim,
+# so scriptable types like text/html or image/svg+xml must not render on our origin
+INLINE_CONTENT_TYPES = frozenset({
+    "image/jpeg", "image/png", "image/gif", "image/webp", "image/heic",
+    "audio/mpeg", "audio/mp4", "audio/aac", "audio/ogg", "audio/wav", "audio/webm",
+    "video/mp4", "video/webm", "video/quicktime",
+})
+
+
+def attachment_url(sha256: str) -> str:
+    return f"/attachments/{sha256}"
+
+
+def blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+
+def served_content_type(content_type: str) -> str:
+    if content_type.split(";")[0].strip().lower() in INLINE_CONTENT_TYPES:
+        return content_type
+    return "application/octet-stream"
+
+
+async def get_readable_blob(psql_db: AsyncSession, user: UserIdentity, sha256: str) -> Optional[AttachmentBlob]:
+    # an uploader, or a side of a conversation the file was sent in
+    uploaded_by_user = select(AttachmentUpload.sha256).where(
+        AttachmentUpload.sha256.__eq__(sha256),
+        AttachmentUpload.user_id.__eq__(user.id),
+    ).exists()
+    sent_to_user = select(MessageAttachment.id).join(
+        Message, Message.id.__eq__(MessageAttachment.message_id)
+    ).where(
+        MessageAttachment.sha256.__eq__(sha256),
+        or_(Message.sender_id.__eq__(user.id), Message.recipient_user_id.__eq__(user.id)),
+    ).exists()
+    return await psql_db.scalar(select(AttachmentBlob).where(
+        AttachmentBlob.sha256.__eq__(sha256),
+        or_(uploaded_by_user, sent_to_user),
+    ))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    (start, end) of a single `bytes=` range, both inclusive. None serves the
+    whole file, which is also the answer to multi-range requests (RFC 9110 14.2).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def make_thumbnail(store: ObjectStore, key: str, size: int) -> bytes:
+    # Pillow is only needed for image thumbnails
+    from PIL import Image, ImageOps
+
+    with store.open(key) as file, Image.open(file) as image:
+        # lets the JPEG decoder downscale while decoding
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=80)
+        return output.getvalue()
+
+
+def make_waveform(store: ObjectStore, key: str, points: int) -> bytes:
+    """Peak per bucket of a PCM WAV file, read one bucket at a time."""
+    with store.open(key) as file, wave.open(file) as audio:
+        width, channels, frames = audio.getsampwidth(), audio.getnchannels(), audio.getnframes()
+        typecode = {1: "B", 2: "h", 4: "i"}.get(width)
+        if typecode is None:
+            raise ValueError(f"Unsupported sample width {width}")
+        full_scale = 1 << (8 * width - 1)
+        bucket = max(frames // points, 1)
+
+        peaks = []
+        while len(peaks) < points:
+            samples = array.array(typecode, audio.readframes(bucket))
+            if not samples:
+                break
+            if width == 1:
+                # 8 bit WAV is unsigned
+                peak = max(abs(sample - 128) for sample in samples)
+            else:
+                peak = max(max(samples), -min(samples))
+            peaks.append(round(min(peak / full_scale, 1.0), 3))
+
+        duration = frames / audio.getframerate()
+    return json.dumps({"duration": duration, "peaks": peaks, "channels": channels}).encode()
+
+
+class DerivationCache:
+    """
+    Derived files (thumbnails, waveforms) by key. Looked up in memory, then
+    in the object store, and computed on a worker thread at most once per key
+    even when several requests ask for it at the same time.
+    """
+
+    def __init__(self, store: ObjectStore, maxsize: int = ATTACHMENT_DERIVATION_CACHE_BYTES):
+        self.store = store
+        self.cache = LRUCache(maxsize=maxsize, getsizeof=len)
+        self.lock = threading.Lock()
+        self.pending: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.computed = 0
+
+    async def get(self, key: str, compute: Callable[[], bytes]) -> bytes:
+        with self.lock:
+            data = self.cache.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        task = self.pending.get(key)
+        if task is None:
+            task = self.pending[key] = asyncio.create_task(self._load(key, compute))
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        # a cancelled request must not cancel the computation others wait for
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, compute: Callable[[], bytes]) -> bytes:
+        data = await self.store.get(key)
+        if data is None:
+            data = await run_in_threadpool(compute)
+            self.computed += 1
+            await self.store.put(key, data)
+        if len(data) <= self.cache.maxsize:
+            with self.lock:
+                self.cache[key] = data
+        return data
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            size, currsize = len(self.cache), self.cache.currsize
+        return {
+            "size": size,
+            "bytes": currsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "computed": self.computed,
+        }
+
+
+derivation_cache = DerivationCache(object_store)
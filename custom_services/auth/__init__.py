@@ -1,10 +1,11 @@
 from typing import List
 from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
 from firebase_admin import auth
 from google.cloud.firestore import DocumentReference
 
 from utils.psql.models import User
-from .utils import create_user_util, delete_user_util
+from .utils import bulk_create_users_util, create_user_util, delete_user_util
 from .schemas import BaseResponseModel, BulkBaseResponseModel, BulkCreateUsersRequest, BulkDeleteUsersRequest, CreateUserModel, DeleteUserModel
 from utils.dependencies import firestore_dependency, psql_dependency
 
@@ -36,13 +37,8 @@ async def bulk_create_users(
     db=firestore_dependency, 
     psql_db = psql_dependency
 ):
-    result: List[BaseResponseModel] = []
-    users = request.users
-    for user_data in users:
-        try:
-            result.append(create_user_util(user_data, db, psql_db))
-        except Exception as e:
-            result.append(BaseResponseModel(success=False, message=f"{user_data.email}, {str(e)}"))
+    # batched pipeline, runs on the threadpool since the Firebase and Firestore calls block
+    result = await run_in_threadpool(bulk_create_users_util, request.users, db, psql_db)
     return BulkBaseResponseModel(result=result)
 
 
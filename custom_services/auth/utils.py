@@ -1,9 +1,18 @@
 
 
+import hashlib
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
 from firebase_admin import auth
 from custom_services.auth.schemas import BaseResponseModel, CreateUserModel, DeleteUserModel
+from utils.psql import get_insert
+from utils.psql.identity import user_identity_resolver
 from utils.psql.models import User
+from utils.web_socket import websocket_manager
 from google.cloud.firestore import Client
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from google.cloud.firestore import DocumentReference
 
@@ -18,10 +27,12 @@ def create_user_util(request: CreateUserModel, db: Client, psql_db: Session ):
     )
 
     # Psql db
-    user = User(email=request.email, display_name=request.display_name)
+    user = User(email=request.email, firebase_uid=user_record.uid, display_name=request.display_name)
     psql_db.add(user)
     psql_db.commit()
     psql_db.refresh(user)
+    # drop a cached "no such user" for this email
+    websocket_manager.identities.invalidate(request.email)
     
     # Firestore collection
     uid = user_record.uid
@@ -42,6 +53,8 @@ def delete_user_util(request: DeleteUserModel, db: Client, psql_db: Session):
     # Firebase auth
     user: auth.UserRecord = auth.get_user_by_email(email)
     auth.delete_user(user.uid)
+    websocket_manager.identities.invalidate(email)
+    user_identity_resolver.invalidate(user.uid)
 
     # Psql db
     sql_user = psql_db.query(User).filter(User.email == email).first()
@@ -53,4 +66,156 @@ def delete_user_util(request: DeleteUserModel, db: Client, psql_db: Session):
     user_doc: DocumentReference = db.collection("users").document(user.uid)
     user_doc.delete()
 
-    return BaseResponseModel(success=True, message="User deleted")
\ No newline at end of file
+    return BaseResponseModel(success=True, message="User deleted")
+
+BULK_IMPORT_CHUNK_SIZE = 1000  # auth.import_users limit
+BULK_LOOKUP_CHUNK_SIZE = 100  # auth.get_users limit
+FIRESTORE_BATCH_SIZE = 500  # WriteBatch limit
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+PBKDF2_ROUNDS = int(os.getenv("BULK_PBKDF2_ROUNDS", "10000"))  # Firebase rehashes on first sign-in
+MIN_PASSWORD_LENGTH = 6  # enforced by create_user, import_users takes any hash
+
+
+def chunked(items: Sequence, size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def hash_password(password: str) -> tuple[bytes, bytes]:
+    salt = secrets.token_bytes(16)
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ROUNDS), salt
+
+
+def bulk_create_users_util(users: List[CreateUserModel], db: Client, psql_db: Session) -> List[BaseResponseModel]:
+    """
+    Bulk version of create_user_util, one result per input row in the same order.
+
+    Firebase accounts go through auth.import_users, Postgres gets one multi-row
+    insert and Firestore is written with batches. Blocking calls run on a
+    bounded thread pool.
+    """
+    result: List[Optional[BaseResponseModel]] = [None] * len(users)
+
+    def fail(index: int, reason: str):
+        result[index] = BaseResponseModel(success=False, message=f"{users[index].email}, {reason}")
+
+    # import_users skips uniqueness checks, filter duplicates and existing accounts first
+    pending: List[int] = []
+    seen_emails: set[str] = set()
+    for index, user_data in enumerate(users):
+        try:
+            # same checks create_user runs, a bad row fails alone
+            auth.EmailIdentifier(user_data.email)
+        except ValueError as e:
+            fail(index, str(e))
+            continue
+        if len(user_data.password) < MIN_PASSWORD_LENGTH:
+            fail(index, f"password must be at least {MIN_PASSWORD_LENGTH} characters long")
+            continue
+        # Firebase stores emails lowercased
+        if user_data.email.lower() in seen_emails:
+            fail(index, "duplicate email in request")
+            continue
+        seen_emails.add(user_data.email.lower())
+        pending.append(index)
+
+    with ThreadPoolExecutor(max_workers=BULK_CONCURRENCY) as executor:
+        lookups = executor.map(
+            lambda chunk: auth.get_users([auth.EmailIdentifier(users[index].email) for index in chunk[1]]),
+            chunked(pending, BULK_LOOKUP_CHUNK_SIZE),
+        )
+        existing_emails = {user.email.lower() for lookup in lookups for user in lookup.users}
+        for index in pending:
+            if users[index].email.lower() in existing_emails:
+                fail(index, "user already exists")
+        pending = [index for index in pending if result[index] is None]
+
+        # and rows already in Postgres, importing them would leave Firebase accounts with no users row
+        for _, chunk in chunked(pending, BULK_IMPORT_CHUNK_SIZE):
+            existing_emails = set(psql_db.scalars(
+                select(func.lower(User.email)).where(func.lower(User.email).in_([users[index].email.lower() for index in chunk]))
+            ))
+            for index in chunk:
+                if users[index].email.lower() in existing_emails:
+                    fail(index, "user already exists in database")
+        pending = [index for index in pending if result[index] is None]
+
+        # Firebase auth
+        uids = {index: secrets.token_urlsafe(21) for index in pending}
+
+        def import_chunk(chunk):
+            records = []
+            for index in chunk:
+                user_data = users[index]
+                password_hash, password_salt = hash_password(user_data.password)
+                try:
+                    records.append(auth.ImportUserRecord(
+                        uid=uids[index],
+                        email=user_data.email,
+                        email_verified=user_data.email_verified,
+                        display_name=user_data.display_name,
+                        password_hash=password_hash,
+                        password_salt=password_salt,
+                    ))
+                except ValueError as e:
+                    fail(index, str(e))
+            # error indexes refer to the records that were built
+            chunk = [index for index in chunk if result[index] is None]
+            if not chunk:
+                return
+            try:
+                import_result = auth.import_users(records, hash_alg=auth.UserImportHash.pbkdf2_sha256(rounds=PBKDF2_ROUNDS))
+            except Exception as e:
+                for index in chunk:
+                    fail(index, str(e))
+                return
+            for error in import_result.errors:
+                fail(chunk[error.index], error.reason)
+
+        list(executor.map(import_chunk, (chunk for _, chunk in chunked(pending, BULK_IMPORT_CHUNK_SIZE))))
+        pending = [index for index in pending if result[index] is None]
+
+        # Psql db
+        if pending:
+            try:
+                inserted = psql_db.scalars(
+                    get_insert(psql_db.get_bind().dialect.name)(User)
+                    .values([{"email": users[index].email, "firebase_uid": uids[index], "display_name": users[index].display_name} for index in pending])
+                    .on_conflict_do_nothing(index_elements=[User.email])
+                    .returning(User.email)
+                ).all()
+                psql_db.commit()
+            except Exception as e:
+                psql_db.rollback()
+                inserted = []
+                for index in pending:
+                    fail(index, str(e))
+            inserted_emails = set(inserted)
+            for index in pending:
+                if result[index] is None and users[index].email not in inserted_emails:
+                    fail(index, "user already exists in database")
+            # roll back the imports that have no users row, a retry can then import them again
+            orphaned = [uids[index] for index in pending if result[index] is not None]
+            list(executor.map(auth.delete_users, (chunk for _, chunk in chunked(orphaned, BULK_IMPORT_CHUNK_SIZE))))
+            pending = [index for index in pending if result[index] is None]
+
+        # Firestore collection
+        def write_batch(chunk):
+            batch = db.batch()
+            for index in chunk:
+                batch.set(db.collection("users").document(uids[index]), {
+                    "uid": uids[index],
+                    "email": users[index].email,
+                    "display_name": users[index].display_name
+                })
+            try:
+                batch.commit()
+            except Exception as e:
+                for index in chunk:
+                    fail(index, str(e))
+
+        list(executor.map(write_batch, (chunk for _, chunk in chunked(pending, FIRESTORE_BATCH_SIZE))))
+
+    for index in pending:
+        websocket_manager.identities.invalidate(users[index].email)
+    return [item or BaseResponseModel(success=True, message="User created") for item in result]
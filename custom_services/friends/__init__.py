@@ -1,34 +1,38 @@
 
 
 import datetime
-from fastapi import APIRouter
-
-from utils.functions import paginate_data
-
-from .schemas import FriendRequestAnswerRequest, FriendRequestAnswerResponse, FriendRequestDetail, FriendRequestRemoveRequest, FriendRequestRemoveResponse, FriendRequestStatus, FriendWithMessageOut, FriendsListRequest, FriendsListResponse, FriendsWithMessageRequest, FriendsWithMessageResponse, SendFriendRequest, SendFriendRequestResponse, UserPreview
-from utils.dependencies import user_verify_dependency, psql_dependency
-from utils.psql.models import FriendRequest, Message, User
-from sqlalchemy import and_, or_, desc
-from sqlalchemy.orm import joinedload, aliased
-from utils.web_socket import WebSocketResponse, WebSocketTypes, websocket_manager
-from sqlalchemy.sql import func, case
+from fastapi import APIRouter, HTTPException, status
+
+from utils.functions import paginate_request, paginated_response
+
+from .schemas import FriendRequestAnswerRequest, FriendRequestAnswerResponse, FriendRequestDetail, FriendRequestRemoveRequest, FriendRequestRemoveResponse, FriendRequestStatus, FriendsListRequest, FriendsListResponse, FriendsWithMessageRequest, FriendsWithMessageResponse, SendFriendRequest, SendFriendRequestResponse, UserPreview
+from utils.dependencies import current_user_dependency, async_psql_dependency, user_loader_dependency
+from utils.psql.conversations import unread_count
+from utils.psql.events import record_events
+from utils.psql.friends import friend_graph_cache
+from utils.psql.outbox import outbox_dispatcher
+from utils.psql.models import Conversation, FriendRequest, User
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+from utils.web_socket import WebSocketResponse, WebSocketTypes
+from sqlalchemy.sql import func
 
 friends_router = APIRouter(prefix="/friends", tags=['Friends'])
 
 
 @friends_router.post("/send_request", response_model=SendFriendRequestResponse)
-async def send_friend_request(request: SendFriendRequest, user=user_verify_dependency, psql_db=psql_dependency):
-    requester_email = user["email"]
+async def send_friend_request(request: SendFriendRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    requester_user = current_user
+    requester_email = requester_user.email if requester_user else None
     recipient_email = request.email
 
-    requester_user = psql_db.query(User).where(User.email.__eq__(requester_email)).first()
-    recipient_user = psql_db.query(User).where(User.email.__eq__(recipient_email)).first()
+    recipient_user = await psql_db.scalar(select(User).where(User.email.__eq__(recipient_email)))
 
     if not requester_user or not recipient_user:
         return SendFriendRequestResponse(success=False, message="User is not available")
     
     # checking is friend request is already present or not
-    is_friend_request_presents = psql_db.query(FriendRequest).where(
+    is_friend_request_presents = (await psql_db.scalars(select(FriendRequest).where(
         or_(
             and_(
                 FriendRequest.recipient_id.__eq__(recipient_user.id),
@@ -39,9 +43,9 @@ async def send_friend_request(request: SendFriendRequest, user=user_verify_depen
                 FriendRequest.requester_id.__eq__(recipient_user.id)
             )
         )
-    ).all()
+    ))).all()
 
-    is_friend_request_present = is_friend_request_presents[0]
+    is_friend_request_present = is_friend_request_presents[0] if is_friend_request_presents else None
 
     # adding new friend request
     friend_request = is_friend_request_present or FriendRequest(
@@ -57,24 +61,27 @@ async def send_friend_request(request: SendFriendRequest, user=user_verify_depen
     # delete extra requests
     if len(is_friend_request_presents) > 1:
         for item in is_friend_request_presents[1:]:
-            psql_db.delete(item)
-
-    psql_db.commit()
-    psql_db.refresh(friend_request)
-
-    # send websocket message
-    await websocket_manager.send_message(recipient_email, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_RECEIVED.value, 
-        data={
-            "message": f"Friend request received from {requester_email}"
-        }
-    ))
-    await websocket_manager.send_message(requester_email, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_SENT.value,
-        data={
-            "message": f"Friend request sent to {recipient_email}"
-        }
-    ))
+            await psql_db.delete(item)
+
+    # websocket events are stored with the change, the outbox dispatcher pushes them after commit
+    await record_events(psql_db, [
+        (recipient_user.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_RECEIVED.value, 
+            data={
+                "message": f"Friend request received from {requester_email}"
+            }
+        )),
+        (requester_user.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_SENT.value,
+            data={
+                "message": f"Friend request sent to {recipient_email}"
+            }
+        )),
+    ])
+
+    await psql_db.commit()
+    friend_graph_cache.invalidate(requester_user.id, recipient_user.id)
+    outbox_dispatcher.notify()
 
     return SendFriendRequestResponse(
         success=True,
@@ -85,24 +92,27 @@ async def send_friend_request(request: SendFriendRequest, user=user_verify_depen
 
 
 @friends_router.post("/answer", response_model=FriendRequestAnswerResponse)
-async def friend_request_answer(request: FriendRequestAnswerRequest, user=user_verify_dependency, psql_db=psql_dependency):
+async def friend_request_answer(request: FriendRequestAnswerRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
     requester_email = request.email
-    recipient_email = user["email"]
+    recipient_user = current_user
+    recipient_email = recipient_user.email if recipient_user else None
 
-    requester_user = psql_db.query(User).where(User.email.__eq__(requester_email)).first()
-    recipient_user = psql_db.query(User).where(User.email.__eq__(recipient_email)).first()
+    requester_user = await psql_db.scalar(select(User).where(User.email.__eq__(requester_email)))
 
     if not requester_user or not recipient_user:
         return FriendRequestAnswerResponse(success=False, message="User is not available")
     
-    friend_request = psql_db.query(FriendRequest).where(
+    friend_request = await psql_db.scalar(select(FriendRequest).where(
         and_(
             FriendRequest.recipient_id.__eq__(recipient_user.id),
             FriendRequest.requester_id.__eq__(requester_user.id),
         )
-    ).first()
+    ))
 
-    if friend_request.status == request.status:
+    if not friend_request:
+        return FriendRequestAnswerResponse(success=False, message="No request found")
+
+    if friend_request.status == request.status.value:
         return FriendRequestAnswerResponse(
             success=True,
             message=f"Friend request already {friend_request.status}"
@@ -113,39 +123,42 @@ async def friend_request_answer(request: FriendRequestAnswerRequest, user=user_v
     friend_request.responded_at = datetime.datetime.now(datetime.timezone.utc)
     psql_db.add(friend_request)
 
-    psql_db.commit()
-
-    # send websocket message
-    await websocket_manager.send_message(requester_email, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_ANSWER.value,
-        data={
-            "message": f"{recipient_email} has {request.status} the request"
-        }
-    ))
-    await websocket_manager.send_message(recipient_email, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_ANSWER.value,
-        data={
-            "message": f"you have {request.status} the request from {requester_email}"
-        }
-    ))
+    await record_events(psql_db, [
+        (requester_user.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_ANSWER.value,
+            data={
+                "message": f"{recipient_email} has {request.status.value} the request"
+            }
+        )),
+        (recipient_user.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_ANSWER.value,
+            data={
+                "message": f"you have {request.status.value} the request from {requester_email}"
+            }
+        )),
+    ])
+
+    await psql_db.commit()
+    friend_graph_cache.invalidate(requester_user.id, recipient_user.id)
+    outbox_dispatcher.notify()
 
     return FriendRequestAnswerResponse(
         success=True,
-        message=f"Friend request {request.status}"
+        message=f"Friend request {request.status.value}"
     )
 
 @friends_router.post("/remove", response_model=FriendRequestRemoveResponse)
-async def friend_request_remove(request: FriendRequestRemoveRequest, user=user_verify_dependency, psql_db=psql_dependency):
-    email1 = user["email"]
+async def friend_request_remove(request: FriendRequestRemoveRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    user1 = current_user
+    email1 = user1.email if user1 else None
     email2 = request.email
 
-    user1 = psql_db.query(User).where(User.email.__eq__(email1)).first()
-    user2 = psql_db.query(User).where(User.email.__eq__(email2)).first()
+    user2 = await psql_db.scalar(select(User).where(User.email.__eq__(email2)))
 
     if not user1 or not user2:
         return FriendRequestAnswerResponse(success=False, message="User is not available")
     
-    friend_request = psql_db.query(FriendRequest).where(
+    friend_request = (await psql_db.scalars(select(FriendRequest).where(
         or_(
             and_(
                 FriendRequest.recipient_id.__eq__(user1.id),
@@ -156,26 +169,29 @@ async def friend_request_remove(request: FriendRequestRemoveRequest, user=user_v
                 FriendRequest.requester_id.__eq__(user1.id),
             )
         )
-    ).all()
+    ))).all()
 
     if len(friend_request) == 0:
         return FriendRequestRemoveResponse(success=False, message="No request found")
     friend_request[0].status = FriendRequestStatus.REMOVED.value
     psql_db.add(friend_request[0])
-    psql_db.commit()
-
-    await websocket_manager.send_message(email1, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_REMOVED,
-        data={
-            "message": f"Friend request with {email2} is removed"
-        }
-    ))
-    await websocket_manager.send_message(email2, WebSocketResponse(
-        type=WebSocketTypes.FRIEND_REQUEST_REMOVED,
-        data={
-            "message": f"Friend request with {email1} is removed"
-        }
-    ))
+    await record_events(psql_db, [
+        (user1.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_REMOVED.value,
+            data={
+                "message": f"Friend request with {email2} is removed"
+            }
+        )),
+        (user2.id, WebSocketResponse(
+            type=WebSocketTypes.FRIEND_REQUEST_REMOVED.value,
+            data={
+                "message": f"Friend request with {email1} is removed"
+            }
+        )),
+    ])
+    await psql_db.commit()
+    friend_graph_cache.invalidate(user1.id, user2.id)
+    outbox_dispatcher.notify()
 
     return FriendRequestRemoveResponse(
         success=True,
@@ -184,104 +200,82 @@ async def friend_request_remove(request: FriendRequestRemoveRequest, user=user_v
 
 
 @friends_router.post("/list", response_model=FriendsListResponse)
-async def get_friend_requests(request: FriendsListRequest, user=user_verify_dependency, psql_db=psql_dependency):
-    user_record = psql_db.query(User).where(User.email.__eq__(user["email"])).first()
-    status = [item.value for item in request.status]
-    friend_requests = psql_db.query(FriendRequest).where(
+async def get_friend_requests(request: FriendsListRequest, current_user=current_user_dependency, psql_db=async_psql_dependency, user_loader=user_loader_dependency):
+    user_record = current_user
+    if not user_record:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    statuses = [item.value for item in request.status]
+    # only the columns the response needs, the users come from the loader
+    friend_requests = select(
+        FriendRequest.id,
+        FriendRequest.requester_id,
+        FriendRequest.recipient_id,
+        FriendRequest.status,
+        FriendRequest.created_at,
+        FriendRequest.updated_at,
+        FriendRequest.responded_at,
+    ).where(
         and_(
-            FriendRequest.status.in_(status),
+            FriendRequest.status.in_(statuses),
             or_(
                 FriendRequest.recipient_id.__eq__(user_record.id),
                 FriendRequest.requester_id.__eq__(user_record.id)
             )
         )
-    ).options(
-        joinedload(FriendRequest.requester), 
-        joinedload(FriendRequest.recipient)
-    ).order_by(FriendRequest.updated_at.desc())
+    )
 
-    data, next_offset, total = paginate_data(friend_requests, request.limit, request.offset)
+    data, page = await paginate_request(
+        psql_db, friend_requests, request, keys=[FriendRequest.updated_at, FriendRequest.id], descending=True
+    )
+    users = await user_loader.load_many([user_id for fr in data for user_id in (fr.requester_id, fr.recipient_id)])
 
-    return FriendsListResponse(
-        data=[
+    return paginated_response(
+        FriendsListResponse,
+        [
             FriendRequestDetail(
                 status=fr.status,
                 created_at=fr.created_at,
                 updated_at=fr.updated_at,
                 responded_at=fr.responded_at,
                 requester=UserPreview(
-                    email=fr.requester.email,
-                    display_name=fr.requester.display_name,
-                    phone=fr.requester.phone
+                    email=users[fr.requester_id].email,
+                    display_name=users[fr.requester_id].display_name,
+                    phone=users[fr.requester_id].phone
                 ),
                 recipient=UserPreview(
-                    email=fr.recipient.email,
-                    display_name=fr.recipient.display_name,
-                    phone=fr.recipient.phone
+                    email=users[fr.recipient_id].email,
+                    display_name=users[fr.recipient_id].display_name,
+                    phone=users[fr.recipient_id].phone
                 )
             )
             for fr in data
         ],
-        next_offset=next_offset,
-        total=total
+        **page
     )
 
 
 @friends_router.post("/friends_with_last_message", response_model=FriendsWithMessageResponse)
-async def get_friends_with_last_message(request: FriendsWithMessageRequest, user_data=user_verify_dependency, psql_db=psql_dependency):
-    current_user_id = psql_db.query(User.id).filter(User.email == user_data["email"]).scalar()
+async def get_friends_with_last_message(request: FriendsWithMessageRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    if not current_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    current_user_id = current_user.id
 
     q = request.q or ""
-    limit = request.limit
-    offset = request.offset
 
     # Aliases
     other_user = aliased(User)
     friend_request = aliased(FriendRequest)
 
-    # Subquery: Get latest message timestamp per friend pair
-    message_time_subq = (
-        psql_db.query(
-            func.max(Message.updated_at).label("last_message_time"),
-            case(
-                (Message.sender_id == current_user_id, Message.recipient_user_id)
-            , else_=Message.sender_id).label("other_user_id")
-        )
-        .filter(
-            or_(
-                and_(Message.sender_id == current_user_id, Message.recipient_user_id != None),
-                and_(Message.recipient_user_id == current_user_id, Message.sender_id != None)
-            )
-        )
-        .group_by("other_user_id")
-        .subquery()
-    )
-
-    # Subquery: Get the actual latest message
-    latest_message_subq = (
-        psql_db.query(Message)
-        .join(
-            message_time_subq,
-            and_(
-                or_(
-                    and_(Message.sender_id == current_user_id, Message.recipient_user_id == message_time_subq.c.other_user_id),
-                    and_(Message.recipient_user_id == current_user_id, Message.sender_id == message_time_subq.c.other_user_id)
-                ),
-                Message.updated_at == message_time_subq.c.last_message_time
-            )
-        )
-        .subquery()
-    )
-
-    latest_message_alias = aliased(Message, latest_message_subq)
-
-    # Main query
+    # Main query, the last message comes from the conversations summary kept by send_message
     query = (
-        psql_db.query(
-            other_user,
+        select(
+            other_user.id,
+            other_user.email,
+            other_user.display_name,
             friend_request.updated_at.label("friend_request_updated_at"),
-            latest_message_alias.text.label("last_message_text"),
-            latest_message_alias.updated_at.label("last_message_updated_at")
+            Conversation.last_text.label("last_message_text"),
+            Conversation.last_activity.label("last_message_updated_at"),
+            unread_count(current_user_id).label("unread"),
         )
         .join(
             friend_request,
@@ -291,10 +285,10 @@ async def get_friends_with_last_message(request: FriendsWithMessageRequest, user
             )
         )
         .outerjoin(
-            latest_message_alias,
+            Conversation,
             or_(
-                and_(latest_message_alias.sender_id == current_user_id, latest_message_alias.recipient_user_id == other_user.id),
-                and_(latest_message_alias.recipient_user_id == current_user_id, latest_message_alias.sender_id == other_user.id),
+                and_(Conversation.user_low_id == current_user_id, Conversation.user_high_id == other_user.id),
+                and_(Conversation.user_high_id == current_user_id, Conversation.user_low_id == other_user.id),
             )
         )
         .filter(friend_request.status == FriendRequestStatus.ACCEPTED.value)
@@ -306,28 +300,33 @@ async def get_friends_with_last_message(request: FriendsWithMessageRequest, user
             or_(
                 other_user.email.ilike(f"%{q}%"),
                 other_user.display_name.ilike(f"%{q}%"),
-                latest_message_alias.text.ilike(f"%{q}%")
+                Conversation.last_text.ilike(f"%{q}%")
             )
         )
 
-    # 📥 Sort by latest message or friend request
-    query = query.order_by(desc(func.coalesce(latest_message_alias.updated_at, friend_request.updated_at)))
-
-    # 📊 Pagination
-    paginated_data, next_offset, total = paginate_data(query, limit, offset)
-
-    return FriendsWithMessageResponse(
-        data=[
-            FriendWithMessageOut(
-                id=user.id,
-                email=user.email,
-                display_name=user.display_name,
-                friend_since=friend_request_updated_at,
-                last_message=last_message_text,
-                last_activity_time=last_message_updated_at or friend_request_updated_at
-            )
-            for user, friend_request_updated_at, last_message_text, last_message_updated_at in paginated_data
+    # 📥 Sort by latest message or friend request, 📊 cursor or offset pagination
+    paginated_data, page = await paginate_request(
+        psql_db,
+        query,
+        request,
+        keys=[func.coalesce(Conversation.last_activity, friend_request.updated_at), other_user.id],
+        descending=True,
+        key_of=lambda row: [row.last_message_updated_at or row.friend_request_updated_at, row.id],
+    )
+
+    return paginated_response(
+        FriendsWithMessageResponse,
+        [
+            {
+                "id": row.id,
+                "email": row.email,
+                "display_name": row.display_name,
+                "friend_since": row.friend_request_updated_at,
+                "last_message": row.last_message_text,
+                "last_activity_time": row.last_message_updated_at or row.friend_request_updated_at,
+                "unread": row.unread or 0,
+            }
+            for row in paginated_data
         ],
-        next_offset=next_offset,
-        total=total
+        **page
     )
@@ -68,6 +68,7 @@ class FriendWithMessageOut(BaseModel):
     friend_since: datetime
     last_message: Optional[str]
     last_activity_time: datetime
+    unread: int = 0
 
 class FriendsWithMessageRequest(PaginatedRequestModel):
     q: Optional[str | None]
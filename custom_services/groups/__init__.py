@@ -0,0 +1,187 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from sqlalchemy import case, delete, func, insert, select, update
+
+from utils.functions import paginate_request, paginated_response
+from utils.psql import get_insert
+from utils.psql.groups import group_member_cache
+from utils.psql.models import Group, GroupMember, Message, User
+from utils.psql.search import get_dialect_name
+from .schemas import GroupAddMembersRequest, GroupAddMembersResponse, GroupCreateRequest, GroupCreateResponse, GroupLeaveRequest, GroupLeaveResponse, GroupListRequest, GroupListResponse, GroupMessagesRequest, GroupMessagesResponse, GroupModel, GroupReadRequest, GroupReadResponse, GroupSendMessageRequest, GroupSendMessageResponse
+from .utils import push_group_message, send_group_message_util
+from utils.dependencies import current_user_dependency, async_psql_dependency
+
+groups_router = APIRouter(prefix="/groups", tags=["Groups"])
+
+
+async def get_members_or_raise(psql_db, group_id: int, current_user):
+    members = await group_member_cache.get(psql_db, group_id) if current_user else None
+    if members is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found"
+        )
+    if current_user.id not in members.ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a member of this group"
+        )
+    return members
+
+
+@groups_router.post("/create", response_model=GroupCreateResponse)
+async def create_group(request: GroupCreateRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    if not current_user:
+        return GroupCreateResponse(success=False, message="User is not available")
+
+    group_id = await psql_db.scalar(
+        insert(Group).values(name=request.name, created_by=current_user.id).returning(Group.id)
+    )
+    member_ids = set((await psql_db.scalars(select(User.id).where(User.email.in_(request.emails)))).all()) if request.emails else set()
+    member_ids.discard(current_user.id)
+    await psql_db.execute(insert(GroupMember), [
+        {"group_id": group_id, "user_id": current_user.id, "is_admin": True},
+        *({"group_id": group_id, "user_id": user_id} for user_id in member_ids),
+    ])
+    await psql_db.commit()
+
+    return GroupCreateResponse(
+        success=True,
+        message="Group created",
+        group=GroupModel(id=group_id, name=request.name),
+    )
+
+
+@groups_router.post("/add_members", response_model=GroupAddMembersResponse)
+async def add_group_members(request: GroupAddMembersRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    await get_members_or_raise(psql_db, request.group_id, current_user)
+    # groups are invite only, the creator and the admins they pick add people
+    is_admin = await psql_db.scalar(select(GroupMember.is_admin).where(
+        GroupMember.group_id.__eq__(request.group_id),
+        GroupMember.user_id.__eq__(current_user.id),
+    ))
+    if not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only group admins can add members"
+        )
+
+    user_ids = (await psql_db.scalars(select(User.id).where(User.email.in_(request.emails)))).all() if request.emails else []
+    if user_ids:
+        # new members start reading from the latest message, not the whole history
+        latest_id = select(func.coalesce(func.max(Message.id), 0)).where(Message.recipient_group_id.__eq__(request.group_id)).scalar_subquery()
+        await psql_db.execute(
+            get_insert(get_dialect_name(psql_db))(GroupMember)
+            .values([{"group_id": request.group_id, "user_id": user_id, "last_read_message_id": latest_id} for user_id in user_ids])
+            .on_conflict_do_nothing(index_elements=[GroupMember.group_id, GroupMember.user_id])
+        )
+        await psql_db.commit()
+        group_member_cache.invalidate(request.group_id)
+
+    return GroupAddMembersResponse(success=True, message="Members added")
+
+
+@groups_router.post("/leave", response_model=GroupLeaveResponse)
+async def leave_group(request: GroupLeaveRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    await get_members_or_raise(psql_db, request.group_id, current_user)
+
+    await psql_db.execute(delete(GroupMember).where(
+        GroupMember.group_id.__eq__(request.group_id),
+        GroupMember.user_id.__eq__(current_user.id),
+    ))
+    await psql_db.commit()
+    group_member_cache.invalidate(request.group_id)
+
+    return GroupLeaveResponse(success=True, message="Left group")
+
+
+@groups_router.post("/send_message", response_model=GroupSendMessageResponse)
+async def send_group_message(request: GroupSendMessageRequest, background_tasks: BackgroundTasks, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    members = await get_members_or_raise(psql_db, request.group_id, current_user)
+
+    message = await send_group_message_util(current_user, request.group_id, members, request.text, psql_db)
+
+    # fan-out runs after the response is sent
+    background_tasks.add_task(push_group_message, message)
+
+    return GroupSendMessageResponse(
+        success=True,
+        message="Message sent",
+        message_id=message.event.data["id"],
+    )
+
+
+@groups_router.post("/messages", response_model=GroupMessagesResponse)
+async def get_group_messages(request: GroupMessagesRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    await get_members_or_raise(psql_db, request.group_id, current_user)
+
+    # served by ix_messages_recipient_group_id_id
+    base_query = select(
+        Message.id, Message.text, Message.created_at, User.email.label("sender_email")
+    ).join(User, User.id.__eq__(Message.sender_id)).where(
+        Message.recipient_group_id.__eq__(request.group_id)
+    )
+
+    messages, page = await paginate_request(psql_db, base_query, request, keys=[Message.id])
+
+    return paginated_response(
+        GroupMessagesResponse,
+        [
+            {
+                "id": msg.id,
+                "group_id": request.group_id,
+                "text": msg.text,
+                "sender": {"email": msg.sender_email},
+                "created_at": msg.created_at,
+            }
+            for msg in messages
+        ],
+        **page
+    )
+
+
+@groups_router.post("/read", response_model=GroupReadResponse)
+async def read_group_messages(request: GroupReadRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    await get_members_or_raise(psql_db, request.group_id, current_user)
+
+    # the cursor only moves forward, a late request from another device can't unread messages.
+    # It's clamped to the group's latest message, a cursor past it would hide every later one
+    latest_id = select(func.coalesce(func.max(Message.id), 0)).where(Message.recipient_group_id.__eq__(request.group_id)).scalar_subquery()
+    cursor = case((latest_id < request.message_id, latest_id), else_=request.message_id)
+    await psql_db.execute(
+        update(GroupMember)
+        .where(
+            GroupMember.group_id.__eq__(request.group_id),
+            GroupMember.user_id.__eq__(current_user.id),
+            GroupMember.last_read_message_id < cursor,
+        )
+        .values(last_read_message_id=cursor)
+    )
+    await psql_db.commit()
+
+    return GroupReadResponse(success=True, message="Read cursor updated")
+
+
+@groups_router.post("/list", response_model=GroupListResponse)
+async def list_groups(request: GroupListRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Current user not found"
+        )
+
+    # own messages never count as unread
+    unread = select(func.count(Message.id)).where(
+        Message.recipient_group_id.__eq__(Group.id),
+        Message.id > GroupMember.last_read_message_id,
+        Message.sender_id.__ne__(current_user.id),
+    ).correlate(Group, GroupMember).scalar_subquery()
+
+    base_query = select(
+        Group.id, Group.name, GroupMember.last_read_message_id, unread.label("unread")
+    ).join(GroupMember, GroupMember.group_id.__eq__(Group.id)).where(
+        GroupMember.user_id.__eq__(current_user.id)
+    )
+
+    groups, page = await paginate_request(psql_db, base_query, request, keys=[Group.id])
+
+    return paginated_response(GroupListResponse, groups, **page)
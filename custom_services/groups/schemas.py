@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+from custom_services.message.schemas import Sender
+from utils.models import BaseResponseModel, PaginatedRequestModel, PaginatedResponseModel
+
+class GroupModel(BaseModel):
+    id: int
+    name: str
+
+class GroupCreateRequest(BaseModel):
+    name: str
+    emails: List[str] = []
+
+class GroupCreateResponse(BaseResponseModel):
+    group: Optional[GroupModel] = None
+
+
+class GroupAddMembersRequest(BaseModel):
+    group_id: int
+    emails: List[str]
+
+class GroupAddMembersResponse(BaseResponseModel):
+    pass
+
+
+class GroupLeaveRequest(BaseModel):
+    group_id: int
+
+class GroupLeaveResponse(BaseResponseModel):
+    pass
+
+
+class GroupSendMessageRequest(BaseModel):
+    group_id: int
+    text: str
+
+class GroupSendMessageResponse(BaseResponseModel):
+    message_id: Optional[int] = None
+
+
+class GroupMessageModel(BaseModel):
+    id: int
+    group_id: int
+    text: Optional[str]
+    sender: Sender
+    created_at: datetime
+
+class GroupMessagesRequest(PaginatedRequestModel):
+    group_id: int
+
+class GroupMessagesResponse(PaginatedResponseModel[GroupMessageModel]):
+    pass
+
+
+class GroupReadRequest(BaseModel):
+    group_id: int
+    message_id: int
+
+class GroupReadResponse(BaseResponseModel):
+    pass
+
+
+class GroupSummary(BaseModel):
+    id: int
+    name: str
+    last_read_message_id: int
+    unread: int
+
+class GroupListRequest(PaginatedRequestModel):
+    pass
+
+class GroupListResponse(PaginatedResponseModel[GroupSummary]):
+    pass
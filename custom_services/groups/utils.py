@@ -0,0 +1,38 @@
+from typing import NamedTuple
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.psql.groups import GroupMembers
+from utils.psql.identity import UserIdentity
+from utils.psql.models import Message
+from utils.web_socket import WebSocketResponse, WebSocketTypes, websocket_manager
+from custom_services.message.schemas import Sender
+from .schemas import GroupMessageModel
+
+
+class SentGroupMessage(NamedTuple):
+    members: GroupMembers
+    event: WebSocketResponse
+
+
+async def send_group_message_util(sender: UserIdentity, group_id: int, members: GroupMembers, text: str, psql_db: AsyncSession) -> SentGroupMessage:
+    """
+    Stores one messages row for the whole group, members read it through
+    recipient_group_id and their read cursor instead of a row each.
+    """
+    message_id, created_at = (await psql_db.execute(
+        insert(Message)
+        .values(text=text, sender_id=sender.id, recipient_group_id=group_id)
+        .returning(Message.id, Message.created_at)
+    )).one()
+    await psql_db.commit()
+
+    model = GroupMessageModel(id=message_id, group_id=group_id, text=text, sender=Sender(email=sender.email), created_at=created_at)
+    # not stored as user events, that would be a row per member again. Clients
+    # catch up after a reconnect with /groups/messages from their read cursor.
+    event = WebSocketResponse(type=WebSocketTypes.GROUP_MESSAGE_RECEIVED.value, data=model.model_dump(mode="json"))
+    return SentGroupMessage(members=members, event=event)
+
+
+async def push_group_message(message: SentGroupMessage):
+    await websocket_manager.send_message_to_users(message.members.users, message.event)
@@ -1,28 +1,28 @@
 
 
-from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import and_, or_
-from sqlalchemy.orm import joinedload
-
-from utils.psql.models import User, Message
-from utils.web_socket import WebSocketResponse, WebSocketTypes, websocket_manager
-from .schemas import MessageGetRequest, MessageGetResponse, MessageModel, Recipient, SendMessageRequest, SendMessageResponse, Sender
-from utils.dependencies import user_verify_dependency, psql_dependency
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from sqlalchemy import case, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from utils.functions import paginate_data, paginate_request, paginated_response
+from utils.psql.conversations import unread_conversations_query
+from utils.psql.models import User, Message, conversation_key
+from utils.psql.search import get_dialect_name, message_search_filter, message_search_rank
+from .schemas import MarkReadRequest, MarkReadResponse, MessageAttachmentModel, MessageGetRequest, MessageGetResponse, MessageModel, Recipient, SendMessageRequest, SendMessageResponse, Sender, UnreadCountModel, UnreadCountsResponse
+from .utils import mark_read_util, push_read_receipt, send_message_util
+from utils.dependencies import current_user_dependency, async_psql_dependency
 
 message_router = APIRouter(prefix="/messaging", tags=["Messaging"])
 
 @message_router.post("/message_get", response_model=MessageGetResponse)
-async def message_get(request: MessageGetRequest, user=user_verify_dependency, psql_db=psql_dependency):
-    user1_email: str = user["email"]
+async def message_get(request: MessageGetRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
+    user1 = current_user
     user2_email: str = request.email
     q = request.q
-    limit = request.limit
-    offset = request.offset
 
-    user1 = psql_db.query(User).filter(User.email == user1_email).first()
-    user2 = psql_db.query(User).filter(User.email == user2_email).first()
+    user2 = await psql_db.scalar(select(User).filter(User.email == user2_email))
 
-    not_found_user = user1_email if not user1 else user2_email if not user2 else None
+    not_found_user = "Current user" if not user1 else user2_email if not user2 else None
     if not_found_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -30,87 +30,104 @@ async def message_get(request: MessageGetRequest, user=user_verify_dependency, p
         )
 
     # Base query for messages between user1 and user2
-    base_query = psql_db.query(Message).filter(
-        or_(
-            and_(Message.sender_id == user1.id, Message.recipient_user_id == user2.id),
-            and_(Message.sender_id == user2.id, Message.recipient_user_id == user1.id),
-        )
+    # both directions share the conversation key, one index seek instead of an OR
+    base_query = select(Message).filter(
+        Message.conversation_key == conversation_key(user1.id, user2.id)
     ).options(
         joinedload(Message.sender),
         joinedload(Message.recipient_user),
+        selectinload(Message.attachments),
     )
 
-    # Optional full-text search (case-insensitive, partial match)
+    # Optional full-text search, served by ix_messages_text_search on postgres
     if q:
-        base_query = base_query.filter(Message.text.ilike(f"%{q}%"))
-
-    total = base_query.count()
-
-    messages = base_query.order_by(Message.created_at.asc()) \
-        .offset(offset).limit(limit).all()
+        if request.cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Search results are paginated with offset"
+            )
+        dialect_name = get_dialect_name(psql_db)
+        # best matches first, a rank can't be a cursor key so this pages by offset
+        base_query = base_query.filter(message_search_filter(dialect_name, q)).order_by(
+            message_search_rank(dialect_name, q).desc(), Message.created_at.desc(), Message.id.desc()
+        )
+        messages, next_offset, total = await paginate_data(psql_db, base_query, request.limit, request.offset)
+        page = {"next_offset": next_offset, "next_cursor": None, "total": total}
+    else:
+        messages, page = await paginate_request(psql_db, base_query, request, keys=[Message.created_at, Message.id])
 
     message_models = [
         MessageModel(
+            id=msg.id,
             text=msg.text,
             sender=Sender(email=msg.sender.email),
             recipient=Recipient(email=msg.recipient_user.email),
+            attachments=[
+                MessageAttachmentModel(file_url=attachment.file_url, file_type=attachment.file_type)
+                for attachment in msg.attachments
+            ],
+            created_at=msg.created_at,
         )
         for msg in messages
     ]
 
-    next_offset = offset + limit if offset + limit < total else None
-
-    return MessageGetResponse(
-        data=message_models,
-        next_offset=next_offset,
-        total=total
-    )
+    return paginated_response(MessageGetResponse, message_models, **page)
 
 
 @message_router.post("/send_message", response_model=SendMessageResponse)
-async def send_message(request: SendMessageRequest, psql_db=psql_dependency, user=user_verify_dependency):
-    sender_email = user["email"]
-    recipient_email = request.email
-
-    sender_user = psql_db.query(User).where(User.email.__eq__(sender_email)).first()
-    recipient_user = psql_db.query(User).where(User.email.__eq__(recipient_email)).first()
-
-    if not sender_user or not recipient_user:
-        return HTTPException(
+async def send_message(request: SendMessageRequest, psql_db=async_psql_dependency, current_user=current_user_dependency):
+    message = await send_message_util(current_user, request.email, request.text, psql_db, request.attachments) if current_user else None
+    if not message:
+        raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    sender_id = sender_user.id
-    recipient_id = recipient_user.id
-
-    message = Message(
-        text=request.text,
-        sender_id=sender_id,
-        recipient_user_id=recipient_id
+
+    return SendMessageResponse(
+        success=True,
+        message="Message sent"
     )
 
-    psql_db.add(message)
-    psql_db.commit()
-    psql_db.refresh(message)
 
-    message = psql_db.query(Message).where(
-        Message.id.__eq__(message.id)
-    ).options(
-        joinedload(Message.sender), 
-        joinedload(Message.recipient_user)
-    ).first()
-
-    message_model = MessageModel(
-            text=message.text,
-            sender=Sender(email=message.sender.email),
-            recipient=Recipient(email=message.recipient_user.email),
+@message_router.post("/read", response_model=MarkReadResponse)
+async def mark_read(request: MarkReadRequest, background_tasks: BackgroundTasks, psql_db=async_psql_dependency, current_user=current_user_dependency):
+    read = await mark_read_util(current_user, request.email, request.message_id, psql_db) if current_user else None
+    if not read:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
 
-    await websocket_manager.send_message(recipient_email, WebSocketResponse(type=WebSocketTypes.MESSAGE_RECEIVED.value, data=message_model.model_dump()))
-    await websocket_manager.send_message(sender_email, WebSocketResponse(type=WebSocketTypes.MESSAGE_SENT.value, data=message_model.model_dump()))
+    background_tasks.add_task(push_read_receipt, read)
 
-    return SendMessageResponse(
+    return MarkReadResponse(
         success=True,
-        message="Message sent"
+        message="Conversation read",
+        unread=read.unread
+    )
+
+
+@message_router.get("/unread_counts", response_model=UnreadCountsResponse)
+async def unread_counts(psql_db=async_psql_dependency, current_user=current_user_dependency):
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Current user not found"
+        )
+
+    # the counters are kept by send_message and /read, no message is counted here
+    query = unread_conversations_query(current_user.id).subquery()
+    other_id = case((query.c.user_low_id.__eq__(current_user.id), query.c.user_high_id), else_=query.c.user_low_id)
+    rows = (await psql_db.execute(
+        select(User.email, query.c.unread, query.c.last_text, query.c.last_activity)
+        .join(query, User.id.__eq__(other_id))
+        .order_by(query.c.last_activity.desc())
+    )).all()
+
+    return UnreadCountsResponse(
+        total=sum(row.unread for row in rows),
+        data=[
+            UnreadCountModel(email=row.email, unread=row.unread, last_message=row.last_text, last_activity_time=row.last_activity)
+            for row in rows
+        ]
     )
@@ -1,5 +1,6 @@
-from typing import Optional
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
 
 from utils.models import BaseResponseModel, PaginatedRequestModel, PaginatedResponseModel
 
@@ -9,10 +10,17 @@ class Recipient(BaseModel):
 class Sender(BaseModel):
     email: str
 
+class MessageAttachmentModel(BaseModel):
+    file_url: str
+    file_type: str
+
 class MessageModel(BaseModel):
+    id: int
     text: str
     recipient: Recipient
     sender: Sender
+    attachments: List[MessageAttachmentModel] = []
+    created_at: datetime
 
 class MessageGetRequest(PaginatedRequestModel):
     email: str
@@ -22,9 +30,33 @@ class MessageGetResponse(PaginatedResponseModel[MessageModel]):
     pass
 
 
+class AttachmentRef(BaseModel):
+    sha256: str = Field(description="sha256 returned by /attachments/upload")
+    file_type: Literal["file", "audio"] = "file"
+
 class SendMessageRequest(BaseModel):
     email: str
     text: str
+    attachments: List[AttachmentRef] = Field(default=[], max_length=10)
 
 class SendMessageResponse(BaseResponseModel):
     pass
+
+
+class MarkReadRequest(BaseModel):
+    email: str
+    message_id: Optional[int] = Field(default=None, description="Last message read, empty to read the whole conversation")
+
+class MarkReadResponse(BaseResponseModel):
+    unread: int = 0
+
+
+class UnreadCountModel(BaseModel):
+    email: str
+    unread: int
+    last_message: Optional[str]
+    last_activity_time: datetime
+
+class UnreadCountsResponse(BaseModel):
+    total: int
+    data: List[UnreadCountModel]
@@ -0,0 +1,141 @@
+from typing import NamedTuple, Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from custom_services.attachments.utils import attachment_url, get_readable_blob
+from utils.psql.conversations import mark_read, unread_count, upsert_conversation
+from utils.psql.events import record_events
+from utils.psql.identity import UserIdentity
+from utils.psql.outbox import outbox_dispatcher
+from utils.psql.models import Conversation, Message, MessageAttachment, User, conversation_key
+from utils.web_socket import WebSocketResponse, WebSocketTypes, websocket_manager
+from .schemas import AttachmentRef, MessageAttachmentModel, MessageModel, Recipient, Sender
+
+
+class ReadMessages(NamedTuple):
+    reader: UserIdentity
+    other: UserIdentity
+    unread: int
+    last_read_id: Optional[int]  # None when the cursor didn't move
+
+
+class SentMessage(NamedTuple):
+    id: int
+    sender: UserIdentity
+    recipient: UserIdentity
+    model: MessageModel
+
+
+async def send_message_util(
+    sender: UserIdentity,
+    recipient_email: str,
+    text: str,
+    psql_db: AsyncSession,
+    attachments: Sequence[AttachmentRef] = (),
+) -> Optional[SentMessage]:
+    """
+    Stores a message with its attachments, updates its conversation and
+    records the websocket events of both users in one transaction.
+
+    The sender comes from the identity resolver, so there is one SELECT for
+    the recipient and the insert uses RETURNING. Returns None when the
+    recipient doesn't exist.
+    """
+    row = (await psql_db.execute(
+        select(User.id, User.email, User.firebase_uid).where(User.email.__eq__(recipient_email))
+    )).first()
+    if row is None:
+        return None
+    recipient = UserIdentity(id=row.id, email=row.email, firebase_uid=row.firebase_uid)
+    if recipient.id == sender.id:
+        # a conversation needs two users
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot send a message to yourself"
+        )
+
+    # only files the sender uploaded or was sent, sending grants the recipient read access
+    for sha256 in {attachment.sha256 for attachment in attachments}:
+        if await get_readable_blob(psql_db, sender, sha256) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Attachment not found"
+            )
+
+    message_id, created_at = (await psql_db.execute(
+        insert(Message)
+        .values(text=text, sender_id=sender.id, recipient_user_id=recipient.id)
+        .returning(Message.id, Message.created_at)
+    )).one()
+
+    attachment_models = [
+        MessageAttachmentModel(file_url=attachment_url(attachment.sha256), file_type=attachment.file_type)
+        for attachment in attachments
+    ]
+    if attachments:
+        await psql_db.execute(insert(MessageAttachment), [
+            {"message_id": message_id, "sha256": attachment.sha256, **model.model_dump()}
+            for attachment, model in zip(attachments, attachment_models)
+        ])
+
+    # keep the inbox summary in the same transaction as the message
+    await psql_db.execute(upsert_conversation(
+        psql_db.bind.dialect.name, message_id, sender.id, recipient.id, text, created_at
+    ))
+
+    model = MessageModel(
+        id=message_id,
+        text=text,
+        sender=Sender(email=sender.email),
+        recipient=Recipient(email=recipient.email),
+        attachments=attachment_models,
+        created_at=created_at,
+    )
+    # the id lets the recipient mark the conversation read up to this message
+    data = model.model_dump(mode="json")
+    # pushed by the outbox dispatcher, and kept for recipients who are offline until their socket resumes
+    await record_events(psql_db, [
+        (recipient.id, WebSocketResponse(type=WebSocketTypes.MESSAGE_RECEIVED.value, data=data)),
+        (sender.id, WebSocketResponse(type=WebSocketTypes.MESSAGE_SENT.value, data=data)),
+    ])
+    await psql_db.commit()
+    outbox_dispatcher.notify()
+
+    return SentMessage(
+        id=message_id,
+        sender=sender,
+        recipient=recipient,
+        model=model,
+    )
+
+
+async def mark_read_util(reader: UserIdentity, other_email: str, message_id: Optional[int], psql_db: AsyncSession) -> Optional[ReadMessages]:
+    """Moves the reader's cursor in the conversation with `other_email`, None when that user doesn't exist."""
+    row = (await psql_db.execute(
+        select(User.id, User.email, User.firebase_uid).where(User.email.__eq__(other_email))
+    )).first()
+    if row is None:
+        return None
+    other = UserIdentity(id=row.id, email=row.email, firebase_uid=row.firebase_uid)
+
+    moved = (await psql_db.execute(mark_read(reader.id, other.id, message_id))).first()
+    if moved is None:
+        # already read that far, report the counter as it is
+        unread = await psql_db.scalar(
+            select(unread_count(reader.id)).where(Conversation.conversation_key.__eq__(conversation_key(reader.id, other.id)))
+        )
+        await psql_db.commit()
+        return ReadMessages(reader=reader, other=other, unread=unread or 0, last_read_id=None)
+    await psql_db.commit()
+    unread, last_read_id = moved
+    return ReadMessages(reader=reader, other=other, unread=unread, last_read_id=last_read_id)
+
+
+async def push_read_receipt(read: ReadMessages):
+    if read.last_read_id is None:
+        return
+    await websocket_manager.send_message_to_user(read.other, WebSocketResponse(
+        type=WebSocketTypes.READ_RECEIPT.value,
+        data={"email": read.reader.email, "message_id": read.last_read_id}
+    ))
@@ -0,0 +1,78 @@
+from fastapi import APIRouter
+
+from custom_services.admin.utils import check_admin_user
+from custom_services.attachments.utils import derivation_cache
+from utils.dependencies import user_verify_dependency
+from utils.firebase import token_verifier
+from utils.psql import engine, async_engine
+from utils.psql.friends import friend_graph_cache
+from utils.psql.groups import group_member_cache
+from utils.psql.identity import user_identity_resolver
+from utils.psql.metrics import pool_snapshot
+from utils.psql.outbox import outbox_dispatcher
+from utils.web_socket import websocket_manager
+from utils.web_socket.compression import compression_metrics
+from .schemas import (
+    CacheMetricsResponse,
+    DbPoolMetricsResponse,
+    DerivationCacheMetricsModel,
+    FriendGraphCacheMetricsModel,
+    GroupMemberCacheMetricsModel,
+    IdentityCacheMetricsModel,
+    PoolMetricsModel,
+    TokenCacheMetricsModel,
+    UserIdentityCacheMetricsModel,
+    WebSocketCompressionMetricsResponse,
+    WebSocketConnectionMetricsResponse,
+    WebSocketOutboxMetricsResponse,
+)
+
+metrics_router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@metrics_router.get("/db_pool", response_model=DbPoolMetricsResponse)
+async def db_pool_metrics(admin_user=user_verify_dependency):
+    check_admin_user(admin_user["email"])
+
+    return DbPoolMetricsResponse(
+        engine=PoolMetricsModel(**pool_snapshot(engine)),
+        async_engine=PoolMetricsModel(**pool_snapshot(async_engine.sync_engine)),
+    )
+
+
+@metrics_router.get("/caches", response_model=CacheMetricsResponse)
+async def cache_metrics(admin_user=user_verify_dependency):
+    check_admin_user(admin_user["email"])
+
+    return CacheMetricsResponse(
+        token=TokenCacheMetricsModel(**token_verifier.snapshot()),
+        identity=IdentityCacheMetricsModel(**websocket_manager.identities.snapshot()),
+        user_identity=UserIdentityCacheMetricsModel(**user_identity_resolver.snapshot()),
+        group_members=GroupMemberCacheMetricsModel(**group_member_cache.snapshot()),
+        friend_graph=FriendGraphCacheMetricsModel(**friend_graph_cache.snapshot()),
+        derivations=DerivationCacheMetricsModel(**derivation_cache.snapshot()),
+    )
+
+
+@metrics_router.get("/ws_compression", response_model=WebSocketCompressionMetricsResponse)
+async def ws_compression_metrics(admin_user=user_verify_dependency):
+    check_admin_user(admin_user["email"])
+
+    # per worker, counts frames sent since startup
+    return WebSocketCompressionMetricsResponse(**compression_metrics.snapshot())
+
+
+@metrics_router.get("/ws_connections", response_model=WebSocketConnectionMetricsResponse)
+async def ws_connection_metrics(admin_user=user_verify_dependency):
+    check_admin_user(admin_user["email"])
+
+    # stale sockets missed at least one heartbeat, reaped ones hit the idle timeout
+    return WebSocketConnectionMetricsResponse(**websocket_manager.snapshot())
+
+
+@metrics_router.get("/ws_outbox", response_model=WebSocketOutboxMetricsResponse)
+async def ws_outbox_metrics(admin_user=user_verify_dependency):
+    check_admin_user(admin_user["email"])
+
+    # lag is from recording the oldest event of a batch to marking it dispatched
+    return WebSocketOutboxMetricsResponse(pending=await outbox_dispatcher.pending(), **outbox_dispatcher.snapshot())
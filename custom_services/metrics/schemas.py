@@ -0,0 +1,90 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class HoldTimeModel(BaseModel):
+    count: int
+    avg_ms: float
+    max_ms: float
+
+class PoolMetricsModel(BaseModel):
+    pool_class: str
+    size: Optional[int]
+    checked_out: Optional[int]
+    overflow: Optional[int]
+    checkouts: int = 0
+    connects: int = 0
+    invalidations: int = 0
+    peak_overflow: int = 0
+    wait: Optional[HoldTimeModel] = None
+    routes: dict[str, HoldTimeModel] = {}
+
+class DbPoolMetricsResponse(BaseModel):
+    engine: PoolMetricsModel
+    async_engine: PoolMetricsModel
+
+class TokenCacheMetricsModel(BaseModel):
+    size: int
+    bytes: int
+    hits: int
+    misses: int
+
+class IdentityCacheMetricsModel(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    negative_hits: int
+    misses: int
+    evictions: int
+    lookup_errors: int
+
+class UserIdentityCacheMetricsModel(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+
+class GroupMemberCacheMetricsModel(UserIdentityCacheMetricsModel):
+    pass
+
+class FriendGraphCacheMetricsModel(UserIdentityCacheMetricsModel):
+    pass
+
+class DerivationCacheMetricsModel(BaseModel):
+    size: int
+    bytes: int
+    hits: int
+    misses: int
+    computed: int
+
+class CacheMetricsResponse(BaseModel):
+    token: TokenCacheMetricsModel
+    identity: IdentityCacheMetricsModel
+    user_identity: UserIdentityCacheMetricsModel
+    group_members: GroupMemberCacheMetricsModel
+    friend_graph: FriendGraphCacheMetricsModel
+    derivations: DerivationCacheMetricsModel
+
+class WebSocketCompressionMetricsResponse(BaseModel):
+    compressed: int
+    skipped: int
+    bytes_in: int
+    bytes_out: int
+    ratio: Optional[float]
+    cpu_ms: float
+
+class WebSocketConnectionMetricsResponse(BaseModel):
+    users: int
+    live: int
+    stale: int
+    reaped: int
+    pings_sent: int
+
+class WebSocketOutboxMetricsResponse(BaseModel):
+    pending: int
+    dispatched: int
+    batches: int
+    errors: int
+    per_second: float
+    last_lag_ms: Optional[float]
+    max_lag_ms: float
@@ -1,64 +1,38 @@
 from fastapi import APIRouter, HTTPException
-from .schemas import SearchUsersRequest, SearchUsersResponse, UserOut
-from utils.dependencies import user_verify_dependency,psql_dependency
-from utils.psql.models import FriendRequest, User
-from sqlalchemy import and_, or_
-from sqlalchemy.orm import aliased
-from utils.functions import paginate_data
+from .schemas import SearchUsersRequest, SearchUsersResponse
+from utils.dependencies import current_user_dependency, async_psql_dependency
+from utils.psql.friends import friend_graph_cache
+from utils.psql.models import User
+from utils.psql.search import get_dialect_name, user_search_filter, user_search_rank
+from sqlalchemy import select
+from utils.functions import paginate_data, paginate_request, paginated_response
+from .utils import annotate_friend_status
 
 social_actions_router = APIRouter(prefix="/social_actions", tags=["SocialActions"])
 
 @social_actions_router.post("/search_users", response_model=SearchUsersResponse)
-async def search_users(request: SearchUsersRequest, user_data=user_verify_dependency, psql_db=psql_dependency):
+async def search_users(request: SearchUsersRequest, current_user=current_user_dependency, psql_db=async_psql_dependency):
     q = request.q or ""
-    limit = request.limit
-    offset = request.offset
-    email = user_data["email"]
 
-    current_user: User = psql_db.query(User).filter(User.email == email).first()
     if not current_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Aliased FriendRequest to allow outer join in both directions
-    FriendRequestAlias = aliased(FriendRequest)
-
-    # Join FriendRequest (in either direction) to get status if exists
-    users_query = (
-        psql_db.query(User, FriendRequestAlias.status.label("friend_status"))
-        .outerjoin(
-            FriendRequestAlias,
-            or_(
-                and_(
-                    FriendRequestAlias.requester_id == current_user.id,
-                    FriendRequestAlias.recipient_id == User.id,
-                ),
-                and_(
-                    FriendRequestAlias.recipient_id == current_user.id,
-                    FriendRequestAlias.requester_id == User.id,
-                ),
-            ),
-        )
-        .filter(User.id != current_user.id)
-    )
+    # friend status comes from the cached friend graph instead of a two-way join per row
+    users_query = select(User.id, User.email, User.display_name, User.phone).filter(User.id != current_user.id)
 
     if q:
-        users_query = users_query.filter(
-            or_(
-                User.email.ilike(f"%{q}%"),
-                User.display_name.ilike(f"%{q}%"),
-            )
+        if request.cursor:
+            raise HTTPException(status_code=400, detail="Search results are paginated with offset")
+        dialect_name = get_dialect_name(psql_db)
+        # best matches first, a rank can't be a cursor key so this pages by offset
+        users_query = users_query.filter(user_search_filter(dialect_name, q)).order_by(
+            user_search_rank(dialect_name, q).desc(), User.email.asc()
         )
+        users_data, next_offset, total = await paginate_data(psql_db, users_query, request.limit, request.offset)
+        page = {"next_offset": next_offset, "next_cursor": None, "total": total}
+    else:
+        users_data, page = await paginate_request(psql_db, users_query, request, keys=[User.email])
+    edges = await friend_graph_cache.get(psql_db, current_user.id)
 
-    users_query = users_query.order_by(User.email.asc())
-
-    users_data, next_offset, total = paginate_data(users_query, limit, offset)
-
-    return SearchUsersResponse(
-        data=[
-            UserOut(**user.__dict__, friend_status=friend_status)  # Add friend_status to your model
-            for user, friend_status in users_data
-        ],
-        next_offset=next_offset,
-        total=total
-    )
+    return paginated_response(SearchUsersResponse, annotate_friend_status(users_data, edges), **page)
     
\ No newline at end of file
@@ -0,0 +1,14 @@
+from utils.psql.friends import FriendEdges
+
+
+def annotate_friend_status(rows, edges: FriendEdges) -> list[dict]:
+    # rows need id, email, display_name and phone, the status is from the viewer's side
+    return [
+        {
+            "email": row.email,
+            "display_name": row.display_name,
+            "phone": row.phone,
+            "friend_status": edges.status(row.id),
+        }
+        for row in rows
+    ]
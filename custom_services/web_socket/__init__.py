@@ -1,16 +1,19 @@
 
 
+from typing import Optional
 from fastapi import HTTPException, WebSocket, APIRouter, WebSocketDisconnect, status
-from firebase_admin import auth
+from utils.firebase import verify_id_token
 from utils.web_socket import websocket_manager
+from utils.web_socket.codecs import negotiate_codec
 from utils.dependencies import user_verify_dependency
+from .utils import handle_frame, resume_events
 
 web_socket_router = APIRouter(tags=["WebSocket"])
 
 @web_socket_router.websocket("/message")
-async def message_socket(websocket: WebSocket, token: str):
+async def message_socket(websocket: WebSocket, token: str, last_seq: Optional[int] = None):
     try:
-        user = auth.verify_id_token(token)
+        user = await verify_id_token(token)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -18,13 +21,25 @@ async def message_socket(websocket: WebSocket, token: str):
         )
 
     user_id = user["uid"]
-    await websocket.accept()
+    # Sec-WebSocket-Protocol: msgpack for binary frames, JSON text otherwise
+    subprotocols = websocket.scope.get("subprotocols", [])
+    codec = negotiate_codec(subprotocols)
+    await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in subprotocols else None)
+    connection = await websocket_manager.connect(user_id, websocket, codec)
     try:
-        websocket_manager.connect(user_id, websocket)
+        # pass the seq of the last event received to get the ones missed while offline
+        await resume_events(user, connection, last_seq)
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive()
+            connection.touch()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+            frame = message.get("bytes") if message.get("text") is None else message["text"]
+            await handle_frame(user, connection, frame)
     except WebSocketDisconnect:
-        websocket_manager.disconnect(user_id)
+        pass
+    finally:
+        await websocket_manager.disconnect(connection)
 
 @web_socket_router.get("/test_socket")
 async def test_socket(user=user_verify_dependency):
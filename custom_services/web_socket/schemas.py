@@ -0,0 +1,22 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class TypingRequest(BaseModel):
+    email: str
+
+class ReadReceiptRequest(BaseModel):
+    email: str
+    message_id: Optional[int] = None  # last message read, the whole conversation by default
+
+class AckModel(BaseModel):
+    id: Optional[str]
+    message_id: Optional[int] = None
+
+class ErrorModel(BaseModel):
+    id: Optional[str]
+    detail: str
+
+class SyncModel(BaseModel):
+    last_seq: int
+    complete: bool  # False when events after the client's last_seq were already pruned, refetch over HTTP
@@ -0,0 +1,146 @@
+import os
+from typing import Optional
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select
+
+from custom_services.message.schemas import SendMessageRequest
+from custom_services.message.utils import mark_read_util, push_read_receipt, send_message_util
+from utils.psql import AsyncSessionLocal
+from utils.psql.events import get_last_seq, iter_events
+from utils.psql.identity import UserIdentity, user_identity_resolver
+from utils.psql.models import User
+from utils.web_socket import WebSocketRequest, WebSocketRequestTypes, WebSocketResponse, WebSocketTypes, websocket_manager
+from utils.web_socket.codecs import Frame
+from utils.web_socket.connection import Connection
+from .schemas import AckModel, ErrorModel, ReadReceiptRequest, SyncModel, TypingRequest
+
+# route label for the pool metrics
+WEB_SOCKET_ROUTE = "/message"
+WS_RESUME_BATCH_SIZE = int(os.getenv("WS_RESUME_BATCH_SIZE", "100"))
+
+
+def reply(connection: Connection, type: WebSocketTypes, data: BaseModel):
+    # through the connection's queue, so replies stay ordered with pushes
+    connection.send(WebSocketResponse(type=type.value, data=data.model_dump()).__dict__)
+
+
+async def resume_events(claims: dict, connection: Connection, last_seq: Optional[int]):
+    """
+    Streams the stored events after `last_seq` in batches, then a SYNC with
+    the stream position, then releases the pushes held since connecting.
+    """
+    position = None
+    complete = True
+    async with AsyncSessionLocal() as psql_db:
+        psql_db.info["route"] = WEB_SOCKET_ROUTE
+        user = await user_identity_resolver.resolve(psql_db, claims)
+        if user:
+            position = await get_last_seq(psql_db, user.id)
+            if last_seq is not None and last_seq != position:
+                # seqs have no gaps, missing the next one means it was already pruned
+                complete = last_seq < position
+                replayed = None
+                async for events in iter_events(psql_db, user.id, last_seq, WS_RESUME_BATCH_SIZE):
+                    if replayed is None and events[0].seq != last_seq + 1:
+                        complete = False
+                    # don't keep a pooled connection while a slow client drains the batch
+                    await psql_db.commit()
+                    for event in events:
+                        if not await connection.put(WebSocketResponse(type=event.type, data=event.data, seq=event.seq).__dict__):
+                            return
+                    replayed = events[-1].seq
+                if replayed is None:
+                    complete = False
+                else:
+                    position = max(position, replayed)
+
+    if position is not None:
+        await connection.put(WebSocketResponse(
+            type=WebSocketTypes.SYNC.value,
+            data=SyncModel(last_seq=position, complete=complete).model_dump()
+        ).__dict__)
+    connection.release(position)
+
+
+async def handle_send_message(claims: dict, connection: Connection, request: WebSocketRequest):
+    data = SendMessageRequest.model_validate(request.data)
+    async with AsyncSessionLocal() as psql_db:
+        psql_db.info["route"] = WEB_SOCKET_ROUTE
+        sender = await user_identity_resolver.resolve(psql_db, claims)
+        message = await send_message_util(sender, data.email, data.text, psql_db, data.attachments) if sender else None
+    if not message:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    # the MESSAGE_SENT event follows through the outbox
+    reply(connection, WebSocketTypes.ACK, AckModel(id=request.id, message_id=message.id))
+
+
+async def handle_typing(claims: dict, connection: Connection, request: WebSocketRequest):
+    data = TypingRequest.model_validate(request.data)
+    # sent on every keystroke, the users row carries the uid so no Firebase lookup is needed
+    async with AsyncSessionLocal() as psql_db:
+        psql_db.info["route"] = WEB_SOCKET_ROUTE
+        recipient = (await psql_db.execute(
+            select(User.id, User.email, User.firebase_uid).where(User.email.__eq__(data.email))
+        )).first()
+    if not recipient:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    reply(connection, WebSocketTypes.ACK, AckModel(id=request.id))
+    await websocket_manager.send_message_to_user(UserIdentity(*recipient), WebSocketResponse(
+        type=WebSocketTypes.TYPING.value,
+        data={"email": claims["email"]}
+    ))
+
+
+async def handle_read_receipt(claims: dict, connection: Connection, request: WebSocketRequest):
+    data = ReadReceiptRequest.model_validate(request.data)
+    async with AsyncSessionLocal() as psql_db:
+        psql_db.info["route"] = WEB_SOCKET_ROUTE
+        reader = await user_identity_resolver.resolve(psql_db, claims)
+        read = await mark_read_util(reader, data.email, data.message_id, psql_db) if reader else None
+    if not read:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    reply(connection, WebSocketTypes.ACK, AckModel(id=request.id))
+    await push_read_receipt(read)
+
+
+async def handle_ping(claims: dict, connection: Connection, request: WebSocketRequest):
+    reply(connection, WebSocketTypes.PONG, AckModel(id=request.id))
+
+
+async def handle_pong(claims: dict, connection: Connection, request: WebSocketRequest):
+    # answer to the manager's PING, receiving it already refreshed last_seen
+    pass
+
+
+HANDLERS = {
+    WebSocketRequestTypes.SEND_MESSAGE: handle_send_message,
+    WebSocketRequestTypes.TYPING: handle_typing,
+    WebSocketRequestTypes.READ_RECEIPT: handle_read_receipt,
+    WebSocketRequestTypes.PING: handle_ping,
+    WebSocketRequestTypes.PONG: handle_pong,
+}
+
+
+async def handle_frame(claims: dict, connection: Connection, frame: Frame):
+    """
+    Handles one inbound frame. Frames are handled in the order they arrive,
+    clients can pipeline them and match the ACK or ERROR replies by id.
+    """
+    try:
+        request = WebSocketRequest.model_validate(connection.codec.decode(frame))
+    except Exception:
+        reply(connection, WebSocketTypes.ERROR, ErrorModel(id=None, detail="Invalid frame"))
+        return
+
+    try:
+        await HANDLERS[request.type](claims, connection, request)
+    except ValidationError:
+        reply(connection, WebSocketTypes.ERROR, ErrorModel(id=request.id, detail=f"Invalid {request.type.value} data"))
+    except HTTPException as e:
+        reply(connection, WebSocketTypes.ERROR, ErrorModel(id=request.id, detail=e.detail))
+    except Exception:
+        reply(connection, WebSocketTypes.ERROR, ErrorModel(id=request.id, detail="Internal error"))
@@ -6,7 +6,15 @@ from custom_services.web_socket import web_socket_router
 from custom_services.friends import friends_router
 from custom_services.message import message_router
 from custom_services.admin import admin_router
+from custom_services.metrics import metrics_router
+from custom_services.groups import groups_router
+from custom_services.attachments import attachments_router
+from contextlib import asynccontextmanager
+from utils.web_socket import websocket_manager
+from utils.psql.outbox import outbox_dispatcher
+from utils.web_socket.compression import WebSocketProtocol
 import firebase_admin
+import uvicorn
 from dotenv import load_dotenv
 import os
 
@@ -27,9 +35,21 @@ config = {
 }
 
 cred_obj = firebase_admin.credentials.Certificate(config)
-default_app = firebase_admin.initialize_app(credential=cred_obj)
+# uvicorn.run("main:app") imports this module again, and once more in every worker
+try:
+    default_app = firebase_admin.get_app()
+except ValueError:
+    default_app = firebase_admin.initialize_app(credential=cred_obj)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await websocket_manager.start()
+    await outbox_dispatcher.start()
+    yield
+    await outbox_dispatcher.stop()
+    await websocket_manager.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,4 +64,20 @@ app.include_router(web_socket_router)
 app.include_router(social_actions_router)
 app.include_router(friends_router)
 app.include_router(message_router)
-app.include_router(admin_router)
\ No newline at end of file
+app.include_router(groups_router)
+app.include_router(attachments_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
+
+# `python main.py` runs with the tuned permessage-deflate, the uvicorn CLI can't select a custom ws protocol
+if __name__ == "__main__":
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        ws=WebSocketProtocol,
+        # protocol level ping frames, clients answer them without app code
+        ws_ping_interval=float(os.getenv("WS_PING_INTERVAL", "20")),
+        ws_ping_timeout=float(os.getenv("WS_PING_TIMEOUT", "20")),
+    )
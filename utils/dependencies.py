@@ -1,9 +1,15 @@
 from google.cloud.firestore import Client
 from fastapi import Depends
 from utils.firebase import get_firestore_db, verify_token
-from utils.psql import get_db
+from utils.psql import get_db, get_async_db
+from utils.psql.identity import get_current_user
+from utils.psql.loaders import get_user_loader
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 firestore_dependency: Client = Depends(get_firestore_db)
 psql_dependency: Session = Depends(get_db)
-user_verify_dependency: dict = Depends(verify_token)
\ No newline at end of file
+async_psql_dependency: AsyncSession = Depends(get_async_db)
+user_verify_dependency: dict = Depends(verify_token)
+current_user_dependency = Depends(get_current_user)
+user_loader_dependency = Depends(get_user_loader)
@@ -1,20 +1,92 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from firebase_admin import firestore
 from google.cloud.firestore import Client
 from firebase_admin import auth
+from starlette.concurrency import run_in_threadpool
 
 def get_firestore_db() -> Client:
     return firestore.client()
 
 security = HTTPBearer()
 
+TOKEN_CACHE_MAX_BYTES = int(os.getenv("TOKEN_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+def _claims_size(claims: dict) -> int:
+    return len(json.dumps(claims, default=str))
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens off the event loop and caches the decoded
+    claims by token hash until the token's `exp`.
+
+    The cache is LRU bounded by the approximate size of the cached claims,
+    and concurrent misses for the same token share a single verification.
+    """
+
+    def __init__(self, max_bytes: int = TOKEN_CACHE_MAX_BYTES):
+        self.cache = TLRUCache(
+            maxsize=max_bytes,
+            ttu=lambda _key, claims, _now: claims["exp"],
+            timer=time.time,
+            getsizeof=_claims_size,
+        )
+        self.pending: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def verify(self, token: str) -> dict:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        claims = self.cache.get(key)
+        if claims is not None:
+            self.hits += 1
+            return claims
+
+        self.misses += 1
+        task = self.pending.get(key)
+        if task is None:
+            # signature checks and public cert fetches are blocking, keep them off the loop
+            task = asyncio.ensure_future(run_in_threadpool(auth.verify_id_token, token))
+            self.pending[key] = task
+            task.add_done_callback(lambda _task: self.pending.pop(key, None))
+        claims = await asyncio.shield(task)
+        try:
+            self.cache[key] = claims
+        except ValueError:
+            # claims larger than the whole cache
+            pass
+        return claims
+
+    def snapshot(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "bytes": self.cache.currsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+token_verifier = TokenVerifier()
+
+
+async def verify_id_token(token: str) -> dict:
+    return await token_verifier.verify(token)
+
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        decoded_token = auth.verify_id_token(credentials.credentials)
+        decoded_token = await verify_id_token(credentials.credentials)
         return decoded_token
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
-        )
\ No newline at end of file
+        )
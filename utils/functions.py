@@ -1,11 +1,105 @@
+import base64
+import datetime
+import json
+from typing import Any, Callable, Iterable, Optional, Sequence, Type, TypeVar, List
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import ColumnElement, Row, Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-
-from typing import Iterable, Sequence, Type, TypeVar, List
-from sqlalchemy.orm import Query
+from utils.models import PaginatedRequestModel, PaginatedResponseModel
 
 paginate_T = TypeVar('T')
-def paginate_data(query: Query[paginate_T], limit: int, offset: int):
-    total=query.count()
-    new_data = query.offset(offset).limit(limit).all()
+
+def selects_single_entity(query: Select) -> bool:
+    # select(User) returns User objects like Query did, select(User, x) returns rows
+    descriptions = query.column_descriptions
+    return len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]
+
+async def paginate_data(db: AsyncSession, query: Select[paginate_T], limit: int, offset: int):
+    offset = offset or 0
+    total = await db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+    result = await db.execute(query.offset(offset).limit(limit))
+    new_data = result.scalars().all() if selects_single_entity(query) else result.all()
     new_end = offset + limit if offset + limit < total else None
     return new_data, new_end, total
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime.datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str, keys: Sequence[ColumnElement]) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(keys):
+            raise ValueError
+        return [
+            datetime.datetime.fromisoformat(value) if key.type.python_type is datetime.datetime else value
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+async def paginate_keyset(
+    db: AsyncSession,
+    query: Select[paginate_T],
+    limit: int,
+    cursor: Optional[str],
+    keys: Sequence[ColumnElement],
+    descending: bool = False,
+    key_of: Optional[Callable[[Any], Sequence[Any]]] = None,
+):
+    """
+    Seek pagination on `keys`, which must be unique together and indexed.
+    Skips the COUNT and the OFFSET scan, `key_of` reads the keys back from a row.
+    """
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        key_tuple, value_tuple = tuple_(*keys), tuple_(*values)
+        query = query.where(key_tuple < value_tuple if descending else key_tuple > value_tuple)
+    query = query.order_by(*(key.desc() if descending else key.asc() for key in keys))
+
+    # one extra row tells whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
+    new_data = result.scalars().all() if selects_single_entity(query) else result.all()
+    if len(new_data) <= limit:
+        return new_data, None
+
+    new_data = new_data[:limit]
+    if key_of is None:
+        key_of = lambda row: [getattr(row, key.key) for key in keys]
+    return new_data, encode_cursor(key_of(new_data[-1]))
+
+async def paginate_request(
+    db: AsyncSession,
+    query: Select[paginate_T],
+    request: PaginatedRequestModel,
+    keys: Sequence[ColumnElement],
+    descending: bool = False,
+    key_of: Optional[Callable[[Any], Sequence[Any]]] = None,
+):
+    """Cursor pagination when the request has no offset, offset pagination otherwise."""
+    if request.offset is None:
+        data, next_cursor = await paginate_keyset(db, query, request.limit, request.cursor, keys, descending, key_of)
+        return data, {"next_offset": None, "next_cursor": next_cursor, "total": None}
+
+    query = query.order_by(*(key.desc() if descending else key.asc() for key in keys))
+    data, next_offset, total = await paginate_data(db, query, request.limit, request.offset)
+    return data, {"next_offset": next_offset, "next_cursor": None, "total": total}
+
+
+def paginated_response(response_model: Type[PaginatedResponseModel], data: Iterable[Any], **page) -> ORJSONResponse:
+    """
+    Validates a page once and renders it with orjson. `data` can hold column
+    rows, dicts or already built models. Routes return it instead of the
+    model, FastAPI then skips validating and encoding the response_model again.
+    """
+    response = response_model.model_validate({
+        "data": [row._asdict() if isinstance(row, Row) else row for row in data],
+        **page,
+    })
+    return ORJSONResponse(response.model_dump())
@@ -1,5 +1,3 @@
-
-
 from typing import Generic, List, Optional, TypeVar
 from pydantic import BaseModel, Field
 
@@ -11,10 +9,12 @@ class BaseResponseModel(BaseModel):
 
 class PaginatedRequestModel(BaseModel):
     limit: int
-    offset: int
+    offset: Optional[int] = Field(default=None, description="Offset pagination, leave empty to paginate with cursor")
+    cursor: Optional[str] = Field(default=None, description="next_cursor of the previous page, empty for the first page")
 
 T = TypeVar('T')
 class PaginatedResponseModel(BaseModel, Generic[T]):
     data: List[T]
-    next_offset: int | None
-    total: int
+    next_offset: int | None = None
+    next_cursor: Optional[str] = None
+    total: Optional[int] = Field(default=None, description="Only counted for offset pagination")
@@ -1,21 +1,82 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from dotenv import load_dotenv
 import os
 
+from .metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
+
 load_dotenv(override=True)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Pool settings, see https://docs.sqlalchemy.org/en/20/core/pooling.html
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+def get_async_database_url(url: str):
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(DATABASE_URL)
+
+def get_engine_options(url, is_async: bool = False) -> dict:
+    options = {
+        "echo": DB_ECHO,
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+        options["connect_args"] = (
+            {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+            if is_async
+            else {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+        )
+    return options
+
+engine = create_engine(DATABASE_URL, **get_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine)
+engine_metrics = instrument_engine(engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+async_engine_metrics = instrument_engine(async_engine.sync_engine)
+
+def get_insert(dialect_name: str):
+    # dialect insert() with ON CONFLICT support, sqlite is only used for local runs
+    return sqlite_insert if dialect_name == "sqlite" else postgresql_insert
+
+def get_route_path(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
 
 # Dependency for FastAPI
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["route"] = get_route_path(request)
     try:
         yield db
     finally:
         db.close()
 
+# Async dependency for FastAPI, queries are awaited instead of blocking the event loop
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        db.info["route"] = get_route_path(request)
+        yield db
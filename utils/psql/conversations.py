@@ -0,0 +1,192 @@
+# Backfill or verify the conversations table with
+# python -m utils.psql.conversations backfill
+# python -m utils.psql.conversations check
+
+import argparse
+import datetime
+import sys
+from typing import Optional
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import get_insert
+from .models import Conversation, Message, conversation_key
+
+
+def upsert_conversation(
+    dialect_name: str,
+    message_id: int,
+    sender_id: int,
+    recipient_id: int,
+    text: Optional[str],
+    created_at: datetime.datetime,
+):
+    """Statement recording a new message on its conversation, run in the same transaction as the insert."""
+    low, high = sorted((sender_id, recipient_id))
+    insert = get_insert(dialect_name)(Conversation).values(
+        conversation_key=conversation_key(sender_id, recipient_id),
+        user_low_id=low,
+        user_high_id=high,
+        last_message_id=message_id,
+        last_text=text,
+        last_activity=created_at,
+        unread_low=int(recipient_id == low),
+        unread_high=int(recipient_id == high),
+    )
+    excluded = insert.excluded
+    # concurrent sends can commit out of order, never move last_* backwards
+    is_newer = excluded.last_activity >= Conversation.last_activity
+    return insert.on_conflict_do_update(
+        index_elements=[Conversation.conversation_key],
+        set_={
+            "last_message_id": case((is_newer, excluded.last_message_id), else_=Conversation.last_message_id),
+            "last_text": case((is_newer, excluded.last_text), else_=Conversation.last_text),
+            "last_activity": case((is_newer, excluded.last_activity), else_=Conversation.last_activity),
+            "unread_low": Conversation.unread_low + excluded.unread_low,
+            "unread_high": Conversation.unread_high + excluded.unread_high,
+            "updated_at": excluded.updated_at,
+        },
+    )
+
+
+def unread_count(user_id: int):
+    """The user's unread counter on a Conversation row they are part of."""
+    return case((Conversation.user_low_id.__eq__(user_id), Conversation.unread_low), else_=Conversation.unread_high)
+
+
+def mark_read(reader_id: int, other_id: int, message_id: Optional[int] = None):
+    """
+    Statement moving the reader's cursor forward to `message_id`, or to the
+    last message, returning (unread, last_read_id). No row when the cursor
+    was already there.
+
+    Reading up to the last message zeroes the counter in the same row update
+    that send_message increments it with. A cursor in the middle recounts the
+    newer messages from the other side.
+    """
+    low, high = sorted((reader_id, other_id))
+    side = "low" if reader_id == low else "high"
+    cursor_column = getattr(Conversation, f"last_read_{side}_id")
+    unread_column = getattr(Conversation, f"unread_{side}")
+    key = conversation_key(reader_id, other_id)
+
+    last_message_id = func.coalesce(Conversation.last_message_id, 0)
+    if message_id is None:
+        cursor, unread = last_message_id, 0
+    else:
+        # clamped, a cursor past the last message would hide every later one from "read to last"
+        cursor = case((last_message_id < message_id, last_message_id), else_=message_id)
+        unread = select(func.count(Message.id)).where(
+            Message.conversation_key.__eq__(key),
+            Message.sender_id.__eq__(other_id),
+            Message.id > message_id,
+        ).scalar_subquery()
+
+    return (
+        update(Conversation)
+        .where(Conversation.conversation_key.__eq__(key), cursor_column < cursor)
+        .values({cursor_column: cursor, unread_column: unread})
+        .returning(unread_column, cursor_column)
+    )
+
+
+def unread_conversations_query(user_id: int):
+    """Conversations with unread messages for the user, served by both user_*_id indexes."""
+    return select(Conversation, unread_count(user_id).label("unread")).where(or_(
+        (Conversation.user_low_id.__eq__(user_id)) & (Conversation.unread_low > 0),
+        (Conversation.user_high_id.__eq__(user_id)) & (Conversation.unread_high > 0),
+    ))
+
+
+def latest_messages_query(keys: Optional[list[str]] = None):
+    conversation = Message.conversation_key.is_not(None) if keys is None else Message.conversation_key.in_(keys)
+    ranked = (
+        select(
+            Message.id,
+            Message.conversation_key,
+            Message.sender_id,
+            Message.recipient_user_id,
+            Message.text,
+            Message.created_at,
+            func.row_number().over(
+                partition_by=Message.conversation_key,
+                order_by=(Message.created_at.desc(), Message.id.desc()),
+            ).label("position"),
+        )
+        # messages to yourself have a key but no conversation row
+        .where(conversation, Message.sender_id.__ne__(Message.recipient_user_id))
+        .subquery()
+    )
+    return select(ranked).where(ranked.c.position == 1)
+
+
+def backfill(db: Session, batch_size: int = 1000) -> int:
+    insert = get_insert(db.get_bind().dialect.name)
+    count = 0
+    last_key = ""
+    # keyset batches over the conversation keys, a commit would close a server side cursor
+    while keys := list(db.scalars(
+        select(Message.conversation_key)
+        .where(Message.conversation_key > last_key)
+        .group_by(Message.conversation_key)
+        .order_by(Message.conversation_key)
+        .limit(batch_size)
+    )):
+        last_key = keys[-1]
+        batch = db.execute(latest_messages_query(keys)).all()
+        if not batch:
+            continue
+        statement = insert(Conversation).values([
+            {
+                "conversation_key": row.conversation_key,
+                "user_low_id": min(row.sender_id, row.recipient_user_id),
+                "user_high_id": max(row.sender_id, row.recipient_user_id),
+                "last_message_id": row.id,
+                "last_text": row.text,
+                "last_activity": row.created_at,
+            }
+            for row in batch
+        ])
+        # unread counters are left alone, they can't be derived from messages
+        statement = statement.on_conflict_do_update(
+            index_elements=[Conversation.conversation_key],
+            set_={
+                "last_message_id": statement.excluded.last_message_id,
+                "last_text": statement.excluded.last_text,
+                "last_activity": statement.excluded.last_activity,
+                "updated_at": statement.excluded.updated_at,
+            },
+        )
+        db.execute(statement)
+        db.commit()
+        count += len(batch)
+    return count
+
+
+def check(db: Session) -> dict[str, list[str]]:
+    expected = {row.conversation_key: row.id for row in db.execute(latest_messages_query())}
+    actual = dict(db.execute(select(Conversation.conversation_key, Conversation.last_message_id)).all())
+    return {
+        "missing": sorted(key for key in expected if key not in actual),
+        "stale": sorted(key for key in expected if key in actual and actual[key] != expected[key]),
+        "orphaned": sorted(key for key in actual if key not in expected),
+    }
+
+
+if __name__ == "__main__":
+    from . import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the conversations summary table")
+    parser.add_argument("command", choices=["backfill", "check"])
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "backfill":
+            print(f"{backfill(db)} conversations backfilled")
+        else:
+            problems = check(db)
+            for kind, keys in problems.items():
+                print(f"{kind}: {len(keys)}")
+                for key in keys[:20]:
+                    print(f"  {key}")
+            sys.exit(1 if any(problems.values()) else 0)
@@ -0,0 +1,61 @@
+import os
+from typing import AsyncIterator
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.web_socket.types import WebSocketResponse
+from . import get_insert
+from .models import UserEvent, UserEventStream
+from .search import get_dialect_name
+
+# events kept per user for resuming sockets, older ones are pruned every WS_EVENT_PRUNE_EVERY events
+WS_EVENT_RETENTION = int(os.getenv("WS_EVENT_RETENTION", "1000"))
+WS_EVENT_PRUNE_EVERY = int(os.getenv("WS_EVENT_PRUNE_EVERY", "100"))
+
+
+async def record_event(db: AsyncSession, user_id: int, event: WebSocketResponse) -> WebSocketResponse:
+    """
+    Stores `event` for the user with the next seq of their stream, in the
+    caller's transaction. Returns the event with its seq set, to be pushed
+    after commit.
+    """
+    # the row lock on the stream orders concurrent events of the same user
+    statement = get_insert(get_dialect_name(db))(UserEventStream).values(user_id=user_id, last_seq=1)
+    seq = await db.scalar(
+        statement.on_conflict_do_update(
+            index_elements=[UserEventStream.user_id],
+            set_={"last_seq": UserEventStream.last_seq + 1},
+        )
+        .returning(UserEventStream.last_seq)
+    )
+    await db.execute(insert(UserEvent).values(user_id=user_id, seq=seq, type=event.type, data=event.data))
+    if seq % WS_EVENT_PRUNE_EVERY == 0:
+        await db.execute(delete(UserEvent).where(UserEvent.user_id.__eq__(user_id), UserEvent.seq <= seq - WS_EVENT_RETENTION))
+    return WebSocketResponse(type=event.type, data=event.data, seq=seq)
+
+
+async def record_events(db: AsyncSession, events: list[tuple[int, WebSocketResponse]]) -> list[WebSocketResponse]:
+    """record_event for several (user_id, event) pairs, returned in the same order."""
+    # stream rows are locked in user id order, so transactions touching the same users can't deadlock
+    recorded: dict[int, WebSocketResponse] = {}
+    for index in sorted(range(len(events)), key=lambda index: events[index][0]):
+        recorded[index] = await record_event(db, *events[index])
+    return [recorded[index] for index in range(len(events))]
+
+
+async def get_last_seq(db: AsyncSession, user_id: int) -> int:
+    return await db.scalar(select(UserEventStream.last_seq).where(UserEventStream.user_id.__eq__(user_id))) or 0
+
+
+async def iter_events(db: AsyncSession, user_id: int, after_seq: int, batch_size: int) -> AsyncIterator[list[UserEvent]]:
+    while True:
+        events = (await db.scalars(
+            select(UserEvent)
+            .where(UserEvent.user_id.__eq__(user_id), UserEvent.seq > after_seq)
+            .order_by(UserEvent.seq)
+            .limit(batch_size)
+        )).all()
+        if not events:
+            return
+        yield events
+        after_seq = events[-1].seq
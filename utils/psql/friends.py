@@ -0,0 +1,94 @@
+import os
+import threading
+from typing import NamedTuple, Optional
+from cachetools import TTLCache
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import FriendRequest
+
+# edges are invalidated by the friends and admin routers in this worker, the ttl bounds staleness on the others
+FRIEND_GRAPH_CACHE_SIZE = int(os.getenv("FRIEND_GRAPH_CACHE_SIZE", "10000"))
+FRIEND_GRAPH_CACHE_TTL = float(os.getenv("FRIEND_GRAPH_CACHE_TTL", "60"))
+
+
+class FriendEdges(NamedTuple):
+    statuses: dict[int, str]  # other user id -> status of the request between them
+    by_status: dict[str, frozenset[int]]
+
+    def status(self, other_id: int) -> Optional[str]:
+        return self.statuses.get(other_id)
+
+    def with_status(self, status: str) -> frozenset[int]:
+        return self.by_status.get(status, frozenset())
+
+
+class FriendGraphCache:
+    """
+    user id -> every friend request they're part of, in either direction,
+    loaded with one SELECT over the requester/recipient indexes so status
+    lookups don't repeat the two-way OR join for every row.
+    """
+
+    def __init__(self, maxsize: int = FRIEND_GRAPH_CACHE_SIZE, ttl: float = FRIEND_GRAPH_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, user_id: int) -> FriendEdges:
+        with self.lock:
+            edges = self.cache.get(user_id)
+        if edges is not None:
+            self.hits += 1
+            return edges
+
+        self.misses += 1
+        rows = (await db.execute(
+            select(FriendRequest.requester_id, FriendRequest.recipient_id, FriendRequest.status)
+            .where(or_(
+                FriendRequest.requester_id.__eq__(user_id),
+                FriendRequest.recipient_id.__eq__(user_id),
+            ))
+            # a pair can have a row in each direction, the latest one wins like in send_request
+            .order_by(FriendRequest.updated_at, FriendRequest.id)
+        )).all()
+        statuses = {
+            row.recipient_id if row.requester_id == user_id else row.requester_id: row.status
+            for row in rows
+        }
+        by_status: dict[str, set[int]] = {}
+        for other_id, status in statuses.items():
+            by_status.setdefault(status, set()).add(other_id)
+        edges = FriendEdges(
+            statuses=statuses,
+            by_status={status: frozenset(ids) for status, ids in by_status.items()},
+        )
+        with self.lock:
+            self.cache[user_id] = edges
+        return edges
+
+    async def status(self, db: AsyncSession, user_id: int, other_id: int) -> Optional[str]:
+        return (await self.get(db, user_id)).status(other_id)
+
+    async def friends(self, db: AsyncSession, user_id: int) -> frozenset[int]:
+        return (await self.get(db, user_id)).with_status("accepted")
+
+    def invalidate(self, *user_ids: int):
+        # both ends of a request, call after the commit
+        with self.lock:
+            for user_id in user_ids:
+                self.cache.pop(user_id, None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            size = len(self.cache)
+        return {
+            "size": size,
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+friend_graph_cache = FriendGraphCache()
@@ -0,0 +1,69 @@
+import os
+import threading
+from typing import NamedTuple, Optional
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .identity import UserIdentity
+from .models import Group, GroupMember, User
+
+# member lists are invalidated on join/leave in this worker, the ttl bounds staleness on the others
+GROUP_MEMBER_CACHE_SIZE = int(os.getenv("GROUP_MEMBER_CACHE_SIZE", "1000"))
+GROUP_MEMBER_CACHE_TTL = float(os.getenv("GROUP_MEMBER_CACHE_TTL", "60"))
+
+
+class GroupMembers(NamedTuple):
+    ids: frozenset[int]
+    users: tuple[UserIdentity, ...]
+
+
+class GroupMemberCache:
+    """
+    group id -> its members, loaded with one SELECT so sending to a group
+    doesn't read group_members on every message. Missing groups aren't cached.
+    """
+
+    def __init__(self, maxsize: int = GROUP_MEMBER_CACHE_SIZE, ttl: float = GROUP_MEMBER_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, group_id: int) -> Optional[GroupMembers]:
+        with self.lock:
+            members = self.cache.get(group_id)
+        if members is not None:
+            self.hits += 1
+            return members
+
+        self.misses += 1
+        if await db.scalar(select(Group.id).where(Group.id.__eq__(group_id))) is None:
+            return None
+        rows = (await db.execute(
+            select(User.id, User.email, User.firebase_uid)
+            .join(GroupMember, GroupMember.user_id.__eq__(User.id))
+            .where(GroupMember.group_id.__eq__(group_id))
+        )).all()
+        users = tuple(UserIdentity(id=row.id, email=row.email, firebase_uid=row.firebase_uid) for row in rows)
+        members = GroupMembers(ids=frozenset(user.id for user in users), users=users)
+        with self.lock:
+            self.cache[group_id] = members
+        return members
+
+    def invalidate(self, group_id: int):
+        with self.lock:
+            self.cache.pop(group_id, None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            size = len(self.cache)
+        return {
+            "size": size,
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+group_member_cache = GroupMemberCache()
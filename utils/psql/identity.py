@@ -0,0 +1,127 @@
+# Resolve the caller's users row from their Firebase token.
+# Fill firebase_uid for users created before the column existed with
+# python -m utils.psql.identity backfill
+
+import argparse
+import os
+import threading
+from typing import NamedTuple, Optional
+from cachetools import TTLCache
+from fastapi import Depends
+from firebase_admin import auth
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from utils.firebase import verify_token
+from . import get_async_db
+from .models import User
+
+USER_IDENTITY_CACHE_SIZE = int(os.getenv("USER_IDENTITY_CACHE_SIZE", "100000"))
+USER_IDENTITY_CACHE_TTL = float(os.getenv("USER_IDENTITY_CACHE_TTL", "3600"))
+LOOKUP_BATCH_SIZE = 100  # auth.get_users limit
+
+
+class UserIdentity(NamedTuple):
+    id: int
+    email: str
+    firebase_uid: str
+
+
+class UserIdentityResolver:
+    """
+    Token uid -> users row, cached in process so authenticated routes don't
+    look the caller up by email on every request.
+
+    Users without firebase_uid yet are matched by the token's email once and
+    linked. Only found users are cached, a missing user may be created later.
+    """
+
+    def __init__(self, maxsize: int = USER_IDENTITY_CACHE_SIZE, ttl: float = USER_IDENTITY_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # invalidated from the auth utils, which run on worker threads
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, db: AsyncSession, claims: dict) -> Optional[UserIdentity]:
+        uid = claims["uid"]
+        with self.lock:
+            identity = self.cache.get(uid)
+        if identity is not None:
+            self.hits += 1
+            return identity
+
+        self.misses += 1
+        columns = (User.id, User.email, User.firebase_uid)
+        row = (await db.execute(select(*columns).where(User.firebase_uid.__eq__(uid)))).first()
+        if row is None:
+            row = (await db.execute(select(*columns).where(User.email.__eq__(claims.get("email"))))).first()
+            if row is None:
+                return None
+            # also relinks an email whose Firebase account was recreated
+            await db.execute(update(User).where(User.id.__eq__(row.id)).values(firebase_uid=uid))
+            await db.commit()
+
+        identity = UserIdentity(id=row.id, email=row.email, firebase_uid=uid)
+        with self.lock:
+            self.cache[uid] = identity
+        return identity
+
+    def invalidate(self, uid: str):
+        with self.lock:
+            self.cache.pop(uid, None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            size = len(self.cache)
+        return {
+            "size": size,
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_identity_resolver = UserIdentityResolver()
+
+
+async def get_current_user(claims: dict = Depends(verify_token), db: AsyncSession = Depends(get_async_db)) -> Optional[UserIdentity]:
+    # shares the request's session with async_psql_dependency
+    return await user_identity_resolver.resolve(db, claims)
+
+
+def backfill(db: Session, batch_size: int = LOOKUP_BATCH_SIZE) -> int:
+    count = 0
+    last_id = 0
+    while True:
+        users = db.execute(
+            select(User.id, User.email)
+            .where(User.firebase_uid.is_(None), User.id > last_id)
+            .order_by(User.id)
+            .limit(batch_size)
+        ).all()
+        if not users:
+            return count
+        last_id = users[-1].id
+
+        result = auth.get_users([auth.EmailIdentifier(user.email) for user in users])
+        uids = {record.email.lower(): record.uid for record in result.users}
+        for user in users:
+            uid = uids.get(user.email.lower())
+            if uid:
+                db.execute(update(User).where(User.id.__eq__(user.id)).values(firebase_uid=uid))
+                count += 1
+        db.commit()
+
+
+if __name__ == "__main__":
+    import main  # noqa: F401, initializes the Firebase app
+    from . import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Link users rows to their Firebase accounts")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(f"{backfill(db)} users linked")
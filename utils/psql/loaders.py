@@ -0,0 +1,52 @@
+from typing import Iterable, NamedTuple, Optional
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import get_async_db
+from .models import User
+
+# ids per IN query, well under the driver's bind parameter limit
+USER_LOADER_BATCH_SIZE = 5000
+
+
+class UserRow(NamedTuple):
+    id: int
+    email: str
+    display_name: str
+    phone: Optional[str]
+
+
+class UserLoader:
+    """
+    Request scoped users by id for building responses. Collect the ids of a
+    page, load_many them in one IN query on the few columns responses show,
+    and reuse the rows for the rest of the request.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.rows: dict[int, Optional[UserRow]] = {}
+        self.queries = 0
+
+    async def load_many(self, ids: Iterable[Optional[int]]) -> dict[int, UserRow]:
+        ids = {user_id for user_id in ids if user_id is not None}
+        missing = sorted(ids - self.rows.keys())
+        for start in range(0, len(missing), USER_LOADER_BATCH_SIZE):
+            batch = missing[start:start + USER_LOADER_BATCH_SIZE]
+            self.queries += 1
+            rows = (await self.db.execute(
+                select(User.id, User.email, User.display_name, User.phone).where(User.id.in_(batch))
+            )).all()
+            # remember deleted users too, so they aren't queried again
+            self.rows.update(dict.fromkeys(batch))
+            self.rows.update((row.id, UserRow(*row)) for row in rows)
+        return {user_id: self.rows[user_id] for user_id in ids if self.rows[user_id] is not None}
+
+    async def load(self, user_id: int) -> Optional[UserRow]:
+        return (await self.load_many([user_id])).get(user_id)
+
+
+async def get_user_loader(db: AsyncSession = Depends(get_async_db)) -> UserLoader:
+    # FastAPI caches dependencies per request, every Depends(get_user_loader) of a request gets this one
+    return UserLoader(db)
@@ -0,0 +1,125 @@
+import time
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class HoldTime:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait = HoldTime()
+        self.peak_overflow = 0
+        self.routes: dict[str, HoldTime] = {}
+
+    def record_wait(self, seconds: float, overflow: int):
+        self.wait.add(seconds)
+        self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def record_hold(self, route: Optional[str], seconds: float):
+        self.routes.setdefault(route or "unknown", HoldTime()).add(seconds)
+
+
+class TimedPoolMixin:
+    """Times how long callers wait for a connection to be handed out."""
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.metrics:
+                self.metrics.record_wait(time.perf_counter() - start, max(self.overflow(), 0))
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, keep the counters
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine: Engine) -> PoolMetrics:
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        route = connection_record.info.pop("route", None)
+        if checked_out_at is not None:
+            metrics.record_hold(route, time.perf_counter() - checked_out_at)
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+    return metrics
+
+
+@event.listens_for(Session, "after_begin")
+def tag_connection_with_route(session: Session, transaction, connection):
+    # get_db/get_async_db put the route path on session.info, carry it to the pool checkin
+    if "route" in session.info:
+        connection.info["route"] = session.info["route"]
+
+
+def pool_snapshot(engine: Engine) -> dict:
+    pool = engine.pool
+    metrics: Optional[PoolMetrics] = getattr(pool, "metrics", None)
+    snapshot = {
+        "pool_class": type(pool).__name__,
+        "size": pool.size() if hasattr(pool, "size") else None,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        # QueuePool counts overflow from -pool_size until the pool is full
+        "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else None,
+    }
+    if metrics:
+        snapshot.update({
+            "checkouts": metrics.checkouts,
+            "connects": metrics.connects,
+            "invalidations": metrics.invalidations,
+            "peak_overflow": metrics.peak_overflow,
+            "wait": metrics.wait.snapshot(),
+            "routes": {route: hold.snapshot() for route, hold in metrics.routes.items()},
+        })
+    return snapshot
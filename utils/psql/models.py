@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import ForeignKey, CheckConstraint, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy import JSON, BigInteger, Integer, ForeignKey, CheckConstraint, Index, PrimaryKeyConstraint, UniqueConstraint, column, func, literal_column
 from sqlalchemy.orm import Mapped, mapped_column, relationship, declarative_base
 
 Base = declarative_base()
@@ -12,9 +12,15 @@ class TimestampMixin:
 
 class User(Base, TimestampMixin):
     __tablename__ = "users"
+    __table_args__ = (
+        # trigram indexes for ILIKE search, need the pg_trgm extension
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_users_display_name_trgm", "display_name", postgresql_using="gin", postgresql_ops={"display_name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(unique=True)
+    firebase_uid: Mapped[Optional[str]] = mapped_column(unique=True, index=True)
     display_name: Mapped[str]
     phone: Mapped[Optional[str]]
 
@@ -26,7 +32,9 @@ class FriendRequest(Base, TimestampMixin):
     __tablename__ = "friend_requests"
     __table_args__ = (
         UniqueConstraint("requester_id", "recipient_id"),
-        CheckConstraint("requester_id <> recipient_id", name="no_self_request")
+        CheckConstraint("requester_id <> recipient_id", name="no_self_request"),
+        Index("ix_friend_requests_requester_id_status", "requester_id", "status"),
+        Index("ix_friend_requests_recipient_id_status", "recipient_id", "status"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -53,16 +61,31 @@ class GroupMember(Base, TimestampMixin):
     __tablename__ = "group_members"
     __table_args__ = (
         PrimaryKeyConstraint("group_id", "user_id"),
+        Index("ix_group_members_user_id", "user_id"),
     )
 
     group_id: Mapped[int] = mapped_column(ForeignKey("groups.id", ondelete="CASCADE"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     is_admin: Mapped[bool] = mapped_column(default=False)
+    last_read_message_id: Mapped[int] = mapped_column(default=0, server_default="0")  # read cursor, unread are the group's messages after it
 
     group = relationship("Group", back_populates="members")
     user = relationship("User")
 
 
+def conversation_key(user_id_1: int, user_id_2: int) -> str:
+    # same key whichever side sent the message, "<lower id>:<higher id>"
+    low, high = sorted((user_id_1, user_id_2))
+    return f"{low}:{high}"
+
+
+def default_conversation_key(context) -> Optional[str]:
+    params = context.get_current_parameters()
+    if params.get("recipient_user_id") is None:
+        return None
+    return conversation_key(params["sender_id"], params["recipient_user_id"])
+
+
 class Message(Base, TimestampMixin):
     __tablename__ = "messages"
     __table_args__ = (
@@ -71,6 +94,15 @@ class Message(Base, TimestampMixin):
             "(recipient_user_id IS NULL AND recipient_group_id IS NOT NULL)",
             name="check_single_recipient"
         ),
+        Index("ix_messages_conversation_key_created_at_id", "conversation_key", "created_at", "id"),
+        Index("ix_messages_sender_id_recipient_user_id_created_at", "sender_id", "recipient_user_id", "created_at"),
+        Index("ix_messages_recipient_group_id_id", "recipient_group_id", "id"),
+        # full text search, utils.psql.search.message_search_vector must build the same expression
+        Index(
+            "ix_messages_text_search",
+            func.to_tsvector(literal_column("'simple'"), func.coalesce(column("text"), literal_column("''"))),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -78,18 +110,99 @@ class Message(Base, TimestampMixin):
     recipient_user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     recipient_group_id: Mapped[Optional[int]] = mapped_column(ForeignKey("groups.id", ondelete="CASCADE"))
     text: Mapped[Optional[str]]
+    conversation_key: Mapped[Optional[str]] = mapped_column(default=default_conversation_key)
 
     sender = relationship("User", foreign_keys=[sender_id])
     recipient_user = relationship("User", foreign_keys=[recipient_user_id])
     attachments = relationship("MessageAttachment", back_populates="message")
 
 
+class AttachmentBlob(Base, TimestampMixin):
+    """Uploaded file content, stored once per sha256 in utils.storage"""
+    __tablename__ = "attachment_blobs"
+
+    sha256: Mapped[str] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    content_type: Mapped[str]
+    created_by: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"))  # first uploader
+
+
+class AttachmentUpload(Base, TimestampMixin):
+    """Every user who uploaded a blob, each of them can read it"""
+    __tablename__ = "attachment_uploads"
+    __table_args__ = (
+        PrimaryKeyConstraint("sha256", "user_id"),
+    )
+
+    sha256: Mapped[str] = mapped_column(ForeignKey("attachment_blobs.sha256", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+
+
 class MessageAttachment(Base, TimestampMixin):
     __tablename__ = "message_attachments"
+    __table_args__ = (
+        Index("ix_message_attachments_message_id", "message_id"),
+        Index("ix_message_attachments_sha256", "sha256"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     message_id: Mapped[int] = mapped_column(ForeignKey("messages.id", ondelete="CASCADE"))
     file_url: Mapped[str]
     file_type: Mapped[str] = mapped_column(CheckConstraint("file_type IN ('file', 'audio')"))
+    sha256: Mapped[Optional[str]] = mapped_column(ForeignKey("attachment_blobs.sha256"))
 
     message = relationship("Message", back_populates="attachments")
+
+
+
+class Conversation(Base, TimestampMixin):
+    __tablename__ = "conversations"
+    __table_args__ = (
+        CheckConstraint("user_low_id < user_high_id", name="ordered_conversation_users"),
+        Index("ix_conversations_user_low_id_last_activity", "user_low_id", "last_activity"),
+        Index("ix_conversations_user_high_id_last_activity", "user_high_id", "last_activity"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    conversation_key: Mapped[str] = mapped_column(unique=True)
+    user_low_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_high_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    last_message_id: Mapped[Optional[int]] = mapped_column(ForeignKey("messages.id", ondelete="SET NULL"))
+    last_text: Mapped[Optional[str]]
+    last_activity: Mapped[datetime]
+    unread_low: Mapped[int] = mapped_column(default=0)  # unread by user_low_id
+    unread_high: Mapped[int] = mapped_column(default=0)  # unread by user_high_id
+    last_read_low_id: Mapped[int] = mapped_column(default=0, server_default="0")  # last message id read by user_low_id
+    last_read_high_id: Mapped[int] = mapped_column(default=0, server_default="0")  # last message id read by user_high_id
+
+
+class UserEventStream(Base):
+    """
+    Per user seq counter of UserEvent, bumped with every recorded event. Kept
+    off users so recording doesn't lock user rows or rewrite users.updated_at.
+    """
+    __tablename__ = "user_event_streams"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_seq: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")  # seq of the user's latest UserEvent
+    dispatch_lease_until: Mapped[Optional[datetime]]  # set while an outbox dispatcher publishes the user's events
+
+
+class UserEvent(Base, TimestampMixin):
+    """
+    Websocket events kept per user so reconnecting sockets can resume from a seq, see utils.psql.events.
+    Also the outbox the dispatcher in utils.psql.outbox pushes them from.
+    """
+    __tablename__ = "user_events"
+    __table_args__ = (
+        UniqueConstraint("user_id", "seq"),
+        # small, only the events still waiting for the dispatcher
+        Index("ix_user_events_undispatched", "id", postgresql_where=column("dispatched_at").is_(None), sqlite_where=column("dispatched_at").is_(None)),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)  # sqlite only autoincrements INTEGER
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    seq: Mapped[int] = mapped_column(BigInteger)
+    type: Mapped[str]
+    data: Mapped[dict] = mapped_column(JSON)
+    dispatched_at: Mapped[Optional[datetime]]  # set once pushed to the user's sockets
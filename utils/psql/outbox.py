@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import os
+import time
+from collections import deque
+from typing import Optional
+from sqlalchemy import func, or_, select, update
+
+from utils.web_socket import WebSocketManager, WebSocketResponse, websocket_manager
+from . import AsyncSessionLocal
+from .identity import UserIdentity
+from .models import User, UserEvent, UserEventStream
+
+WS_OUTBOX_BATCH_SIZE = int(os.getenv("WS_OUTBOX_BATCH_SIZE", "500"))
+# seconds between polls when idle, notify() wakes the dispatcher of this worker right away
+WS_OUTBOX_POLL_INTERVAL = float(os.getenv("WS_OUTBOX_POLL_INTERVAL", "1"))
+# a crashed dispatcher's users are picked up again after this many seconds
+WS_OUTBOX_LEASE = float(os.getenv("WS_OUTBOX_LEASE", "30"))
+# route label for the pool metrics
+OUTBOX_ROUTE = "outbox"
+THROUGHPUT_WINDOW = 60.0
+
+
+class OutboxDispatcher:
+    """
+    Pushes user_events to sockets after the transaction that recorded them
+    committed, so routes don't wait on uid lookups or sockets and a crash
+    after commit doesn't lose the notification.
+
+    Every worker can run a dispatcher. A batch leases its recipients on
+    user_event_streams, claimed with FOR UPDATE SKIP LOCKED in a short
+    transaction, so each user's events are published by one dispatcher at a
+    time and in seq order. Events are marked dispatched after they were
+    published, a crash in between publishes them again once the lease
+    expired, clients drop seqs they've seen.
+    """
+
+    def __init__(
+        self,
+        manager: WebSocketManager,
+        batch_size: int = WS_OUTBOX_BATCH_SIZE,
+        poll_interval: float = WS_OUTBOX_POLL_INTERVAL,
+        lease: float = WS_OUTBOX_LEASE,
+    ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dispatched = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.window: deque[tuple[float, int]] = deque()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def notify(self):
+        # called after a commit that recorded events
+        self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                count = await self.dispatch()
+            except Exception:
+                # keep draining, the events stay in the outbox
+                self.errors += 1
+                count = 0
+            if count < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def dispatch(self) -> int:
+        """Publishes one batch of undispatched events, returns how many."""
+        async with AsyncSessionLocal() as db:
+            db.info["route"] = OUTBOX_ROUTE
+            now = datetime.datetime.utcnow()
+            # whole users are leased, so only one dispatcher publishes a user's events and they go out in seq order
+            lease_free = or_(UserEventStream.dispatch_lease_until.is_(None), UserEventStream.dispatch_lease_until < now)
+            candidates = (
+                select(UserEventStream.user_id)
+                .where(
+                    UserEventStream.user_id.in_(select(UserEvent.user_id).where(UserEvent.dispatched_at.is_(None))),
+                    lease_free,
+                )
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            # the lease condition is checked again by the UPDATE, two dispatchers can't both take a user
+            user_ids = (await db.scalars(
+                update(UserEventStream)
+                .where(UserEventStream.user_id.in_(candidates), lease_free)
+                .values(dispatch_lease_until=now + datetime.timedelta(seconds=self.lease))
+                .returning(UserEventStream.user_id)
+            )).all()
+            if not user_ids:
+                await db.commit()
+                return 0
+            rows = (await db.execute(
+                select(
+                    UserEvent.id, UserEvent.user_id, UserEvent.seq, UserEvent.type, UserEvent.data, UserEvent.created_at,
+                    User.email, User.firebase_uid,
+                )
+                .join(User, User.id.__eq__(UserEvent.user_id))
+                .where(UserEvent.user_id.in_(user_ids), UserEvent.dispatched_at.is_(None))
+                .order_by(UserEvent.id)
+                .limit(self.batch_size)
+            )).all()
+            # no locks are held while publishing, the lease keeps other dispatchers off these users
+            await db.commit()
+
+            try:
+                # one entry per recipient, their events in seq order
+                per_user: dict[int, tuple[UserIdentity, list[WebSocketResponse]]] = {}
+                for row in sorted(rows, key=lambda row: (row.user_id, row.seq)):
+                    user = UserIdentity(id=row.user_id, email=row.email, firebase_uid=row.firebase_uid)
+                    per_user.setdefault(row.user_id, (user, []))[1].append(
+                        WebSocketResponse(type=row.type, data=row.data, seq=row.seq)
+                    )
+                await self.manager.send_events(list(per_user.values()))
+
+                now = datetime.datetime.utcnow()
+                if rows:
+                    await db.execute(
+                        update(UserEvent).where(UserEvent.id.in_([row.id for row in rows])).values(dispatched_at=now)
+                    )
+            finally:
+                # a failed publish is retried by the next batch, not after the lease expired
+                await db.execute(
+                    update(UserEventStream).where(UserEventStream.user_id.in_(user_ids)).values(dispatch_lease_until=None)
+                )
+                await db.commit()
+
+        if rows:
+            self.record(len(rows), (now - min(row.created_at for row in rows)).total_seconds())
+        return len(rows)
+
+    def record(self, count: int, lag: float):
+        now = time.monotonic()
+        self.dispatched += count
+        self.batches += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.window.append((now, count))
+        while self.window and self.window[0][0] < now - THROUGHPUT_WINDOW:
+            self.window.popleft()
+
+    async def pending(self) -> int:
+        # served by ix_user_events_undispatched
+        async with AsyncSessionLocal() as db:
+            db.info["route"] = OUTBOX_ROUTE
+            return await db.scalar(select(func.count(UserEvent.id)).where(UserEvent.dispatched_at.is_(None)))
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        recent = sum(count for at, count in self.window if at >= now - THROUGHPUT_WINDOW)
+        return {
+            "dispatched": self.dispatched,
+            "batches": self.batches,
+            "errors": self.errors,
+            "per_second": round(recent / THROUGHPUT_WINDOW, 3),
+            "last_lag_ms": round(self.last_lag * 1000, 3) if self.last_lag is not None else None,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+outbox_dispatcher = OutboxDispatcher(websocket_manager)
@@ -0,0 +1,42 @@
+from sqlalchemy import ColumnElement, case, func, literal_column, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Message, User
+
+# 'simple' doesn't stem or drop stop words, messages mix languages and names
+TEXT_SEARCH_CONFIG = "simple"
+
+
+def get_dialect_name(db: AsyncSession) -> str:
+    return db.bind.dialect.name
+
+
+def message_search_vector() -> ColumnElement:
+    # must match the expression of ix_messages_text_search, literals included, to use the index
+    return func.to_tsvector(literal_column(f"'{TEXT_SEARCH_CONFIG}'"), func.coalesce(Message.text, literal_column("''")))
+
+
+def user_search_filter(dialect_name: str, q: str, user=User) -> ColumnElement:
+    # on postgres the gin_trgm_ops indexes serve ILIKE '%q%' directly
+    pattern = f"%{q}%"
+    return or_(user.email.ilike(pattern), user.display_name.ilike(pattern))
+
+
+def user_search_rank(dialect_name: str, q: str, user=User) -> ColumnElement:
+    if dialect_name == "postgresql":
+        return func.greatest(func.similarity(user.email, q), func.similarity(user.display_name, q))
+    # without pg_trgm, prefix matches rank first
+    prefix = f"{q}%"
+    return case((or_(user.email.ilike(prefix), user.display_name.ilike(prefix)), 1), else_=0)
+
+
+def message_search_filter(dialect_name: str, q: str) -> ColumnElement:
+    if dialect_name == "postgresql":
+        return message_search_vector().op("@@")(func.plainto_tsquery(TEXT_SEARCH_CONFIG, q))
+    return Message.text.ilike(f"%{q}%")
+
+
+def message_search_rank(dialect_name: str, q: str) -> ColumnElement:
+    if dialect_name == "postgresql":
+        return func.ts_rank(message_search_vector(), func.plainto_tsquery(TEXT_SEARCH_CONFIG, q))
+    return case((Message.text.ilike(f"{q}%"), 1), else_=0)
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterable, AsyncIterator, BinaryIO, NamedTuple, Optional
+from starlette.concurrency import run_in_threadpool
+
+ATTACHMENT_STORE_PATH = os.getenv("ATTACHMENT_STORE_PATH", "attachments")
+ATTACHMENT_CHUNK_SIZE = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(64 * 1024)))
+
+
+class ObjectTooLarge(Exception):
+    pass
+
+
+class StagedObject(NamedTuple):
+    token: str  # store specific handle of the staged data
+    sha256: str
+    size: int
+
+
+class ObjectStore:
+    """
+    Blob storage for attachments, keys are "/" separated paths.
+
+    Uploads are staged first and hashed while they stream in, `commit` then
+    moves them under their content key, so identical files are stored once.
+    """
+
+    async def stage(self, chunks: AsyncIterable[bytes], max_size: Optional[int] = None) -> StagedObject:
+        raise NotImplementedError
+
+    async def commit(self, staged: StagedObject, key: str) -> bool:
+        """Moves staged data to `key`, False when `key` already existed and the staged copy was dropped."""
+        raise NotImplementedError
+
+    async def discard(self, staged: StagedObject):
+        raise NotImplementedError
+
+    async def size(self, key: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Bytes start..end (inclusive) of `key` in chunks, the whole object by default."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """Blocking file object for parsers that need one, only call it from a worker thread."""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[bytes]:
+        # whole object in memory, only for small ones like derivations
+        raise NotImplementedError
+
+    async def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """Filesystem store rooted at `root`, the stand-in for an object storage bucket."""
+
+    def __init__(self, root: str = ATTACHMENT_STORE_PATH, chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+        self.root = os.path.abspath(root)
+        self.staging = os.path.join(self.root, ".staging")
+        self.chunk_size = chunk_size
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid key {key!r}")
+        return path
+
+    def _open_staging(self) -> tuple[BinaryIO, str]:
+        os.makedirs(self.staging, exist_ok=True)
+        fd, token = tempfile.mkstemp(dir=self.staging)
+        return os.fdopen(fd, "wb"), token
+
+    def _remove_staging(self, file: BinaryIO, token: str):
+        file.close()
+        os.remove(token)
+
+    async def stage(self, chunks: AsyncIterable[bytes], max_size: Optional[int] = None) -> StagedObject:
+        file, token = await run_in_threadpool(self._open_staging)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ObjectTooLarge
+                digest.update(chunk)
+                await run_in_threadpool(file.write, chunk)
+        except BaseException:
+            await run_in_threadpool(self._remove_staging, file, token)
+            raise
+        await run_in_threadpool(file.close)
+        return StagedObject(token=token, sha256=digest.hexdigest(), size=size)
+
+    def _commit(self, staged: StagedObject, key: str) -> bool:
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(staged.token)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # atomic on the same filesystem, readers never see a partial file
+        os.replace(staged.token, path)
+        return True
+
+    async def commit(self, staged: StagedObject, key: str) -> bool:
+        return await run_in_threadpool(self._commit, staged, key)
+
+    async def discard(self, staged: StagedObject):
+        try:
+            await run_in_threadpool(os.remove, staged.token)
+        except FileNotFoundError:
+            pass
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return await run_in_threadpool(os.path.getsize, self.path(key))
+        except FileNotFoundError:
+            return None
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        file = await run_in_threadpool(open, self.path(key), "rb")
+        try:
+            await run_in_threadpool(file.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await run_in_threadpool(file.read, self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(file.close)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await run_in_threadpool(self._get, key)
+
+    def _put(self, key: str, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(self.staging, exist_ok=True)
+        fd, token = tempfile.mkstemp(dir=self.staging)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(token, path)
+
+    async def put(self, key: str, data: bytes):
+        await run_in_threadpool(self._put, key, data)
+
+
+def create_object_store() -> ObjectStore:
+    return LocalObjectStore(ATTACHMENT_STORE_PATH)
+
+
+object_store = create_object_store()
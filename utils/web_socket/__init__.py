@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from fastapi import WebSocket, status
+
+from .broker import Broker, create_broker
+from .codecs import Codec, JSON_CODEC
+from .connection import Connection
+from .identity import IdentityCache
+from .types import WebSocketRequest, WebSocketRequestTypes, WebSocketResponse, WebSocketTypes
+
+# a socket silent for WS_HEARTBEAT_INTERVAL gets a PING, one silent for WS_IDLE_TIMEOUT is closed.
+# Protocol level pongs never reach the app, so clients that don't answer PING look idle: reaping
+# stays off (0) until they do, uvicorn's ws_ping_interval already drops dead connections
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "0"))
+WS_FANOUT_BATCH_SIZE = int(os.getenv("WS_FANOUT_BATCH_SIZE", "500"))
+
+class WebSocketManager:
+    connections: dict[str, set[Connection]] = {}
+    def __init__(
+        self,
+        broker: Optional[Broker] = None,
+        identities: Optional[IdentityCache] = None,
+        heartbeat_interval: float = WS_HEARTBEAT_INTERVAL,
+        idle_timeout: float = WS_IDLE_TIMEOUT,
+    ):
+        self.connections = {}
+        self.broker = broker
+        self.identities = identities or IdentityCache()
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.reaper: Optional[asyncio.Task] = None
+        self.pings_sent = 0
+        self.reaped = 0
+        # encoded frames of the last delivered payload, reused while a fan-out delivers the same dict
+        self.last_payload: Optional[dict] = None
+        self.last_frames: dict = {}
+
+    async def start(self):
+        # broker is created lazily so WEBSOCKET_BROKER_URL is read after the env is loaded
+        if self.broker is None:
+            self.broker = create_broker()
+        await self.broker.start(self.deliver)
+        self.reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self.reaper:
+            self.reaper.cancel()
+            self.reaper = None
+        for connections in list(self.connections.values()):
+            for connection in list(connections):
+                await self.disconnect(connection)
+        if self.broker:
+            await self.broker.stop()
+
+    async def connect(self, user_id: str, websocket: WebSocket, codec: Codec = JSON_CODEC) -> Connection:
+        connection = Connection(user_id, websocket, codec)
+        connection.start(self.disconnect)
+        if user_id not in self.connections:
+            self.connections[user_id] = set()
+            await self.broker.subscribe(user_id)
+        self.connections[user_id].add(connection)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        connection.close()
+        connections = self.connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.connections[connection.user_id]
+            await self.broker.unsubscribe(connection.user_id)
+
+    async def _reap(self):
+        # half-open sockets never raise WebSocketDisconnect, close them from here
+        ping = WebSocketResponse(type=WebSocketTypes.PING.value, data={}).__dict__
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for connections in list(self.connections.values()):
+                for connection in list(connections):
+                    idle = now - connection.last_seen
+                    if self.idle_timeout and idle >= self.idle_timeout:
+                        self.reaped += 1
+                        # the writer closes the socket and calls disconnect
+                        connection.close(code=status.WS_1001_GOING_AWAY)
+                    elif idle >= self.heartbeat_interval:
+                        self.pings_sent += 1
+                        connection.send(ping)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        connections = [connection for user_connections in self.connections.values() for connection in user_connections]
+        return {
+            "users": len(self.connections),
+            "live": len(connections),
+            "stale": sum(1 for connection in connections if now - connection.last_seen >= self.heartbeat_interval),
+            "reaped": self.reaped,
+            "pings_sent": self.pings_sent,
+        }
+
+    async def get_id_from_email(self, email: str) -> Optional[str]:
+        return await self.identities.get(email)
+
+    async def deliver(self, user_id: str, payload: dict):
+        # called by the broker for uids this worker is subscribed to.
+        # Only enqueues, each device's writer task does the actual send.
+        if payload is not self.last_payload:
+            self.last_payload, self.last_frames = payload, {}
+        frames = self.last_frames
+        evicted = [
+            connection
+            for connection in list(self.connections.get(user_id, ()))
+            if not connection.send(payload, frames)
+        ]
+        for connection in evicted:
+            await self.disconnect(connection)
+
+    async def send_message_to_user_id(self, user_id: str, data: WebSocketResponse):
+        await self.broker.publish(user_id, data.__dict__)
+    
+    async def send_message_to_user(self, user, data: WebSocketResponse):
+        # takes a User row or UserIdentity, rows not linked to Firebase yet go through the email lookup
+        if user.firebase_uid:
+            await self.send_message_to_user_id(user.firebase_uid, data)
+        else:
+            await self.send_message(user.email, data)
+
+    async def send_message_to_users(self, users: list, data: WebSocketResponse, batch_size: int = WS_FANOUT_BATCH_SIZE):
+        """
+        send_message_to_user for many users with the same payload. Unlinked
+        users are looked up in batches, publishes go out batch_size at a time
+        so a large group doesn't hold the loop for the whole fan-out.
+        """
+        uids = [user.firebase_uid for user in users if user.firebase_uid]
+        emails = [user.email for user in users if not user.firebase_uid]
+        if emails:
+            uids.extend(uid for uid in (await self.identities.get_many(emails)).values() if uid)
+
+        payload = data.__dict__
+        for start in range(0, len(uids), batch_size):
+            await self.broker.publish_many(uids[start:start + batch_size], payload)
+            await asyncio.sleep(0)
+
+    async def send_events(self, events: list[tuple[object, list[WebSocketResponse]]]):
+        """
+        (user, events) pairs as the outbox dispatcher coalesces them, published
+        as one batch per user that is delivered in order. Unlinked users are
+        looked up in one batch.
+        """
+        emails = [user.email for user, _ in events if not user.firebase_uid]
+        uids = await self.identities.get_many(emails) if emails else {}
+        batches = []
+        for user, user_events in events:
+            uid = user.firebase_uid or uids.get(user.email)
+            if uid:
+                batches.append((uid, [event.__dict__ for event in user_events]))
+        if batches:
+            await self.broker.publish_batches(batches)
+
+    async def send_message(self, user_email: str, data: WebSocketResponse):
+        uid = await self.get_id_from_email(user_email)
+        if uid:
+            await self.send_message_to_user_id(uid, data)
+        
+
+websocket_manager = WebSocketManager()
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+# Called with (user_id, payload) for every event published to a user this worker subscribed to
+MessageHandler = Callable[[str, dict], Awaitable[None]]
+
+
+class Broker:
+    """
+    Pub/sub transport between uvicorn workers.
+
+    Every worker subscribes to the uids whose sockets it holds, so publishing
+    to a uid reaches that user no matter which worker served the request.
+    """
+    handler: Optional[MessageHandler] = None
+
+    async def start(self, handler: MessageHandler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def subscribe(self, user_id: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, user_id: str):
+        raise NotImplementedError
+
+    async def publish(self, user_id: str, payload: dict):
+        raise NotImplementedError
+
+    async def publish_many(self, user_ids: list[str], payload: dict):
+        # same payload to many users, group fan-out
+        for user_id in user_ids:
+            await self.publish(user_id, payload)
+
+    async def publish_batches(self, batches: list[tuple[str, list[dict]]]):
+        # several payloads per user, delivered in list order, the outbox dispatcher
+        for user_id, payloads in batches:
+            for payload in payloads:
+                await self.publish(user_id, payload)
+
+
+class InMemoryBroker(Broker):
+    """
+    Process-local broker, used by default with a single worker.
+
+    Brokers sharing a `hub` behave like workers sharing one Redis server,
+    which makes it the local stand-in for multi-worker tests.
+    """
+    default_hub: dict[str, set["InMemoryBroker"]] = {}
+
+    def __init__(self, hub: Optional[dict[str, set["InMemoryBroker"]]] = None):
+        self.hub = self.default_hub if hub is None else hub
+
+    async def subscribe(self, user_id: str):
+        self.hub.setdefault(user_id, set()).add(self)
+
+    async def unsubscribe(self, user_id: str):
+        brokers = self.hub.get(user_id)
+        if brokers is None:
+            return
+        brokers.discard(self)
+        if not brokers:
+            del self.hub[user_id]
+
+    async def publish(self, user_id: str, payload: dict):
+        for broker in list(self.hub.get(user_id, ())):
+            if broker.handler:
+                await broker.handler(user_id, payload)
+
+    async def stop(self):
+        for user_id in [user_id for user_id, brokers in self.hub.items() if self in brokers]:
+            await self.unsubscribe(user_id)
+        await super().stop()
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub broker with one channel per uid, `<prefix><uid>`."""
+
+    def __init__(self, url: str, prefix: str = "ws:user:", poll_interval: float = 1.0):
+        # redis is only needed when a broker url is configured
+        from redis import asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.pubsub = self.redis.pubsub()
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+        self.listener: Optional[asyncio.Task] = None
+
+    def channel(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}"
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+        await super().stop()
+
+    async def subscribe(self, user_id: str):
+        await self.pubsub.subscribe(self.channel(user_id))
+
+    async def unsubscribe(self, user_id: str):
+        await self.pubsub.unsubscribe(self.channel(user_id))
+
+    async def publish(self, user_id: str, payload: dict):
+        await self.redis.publish(self.channel(user_id), json.dumps(payload))
+
+    async def publish_many(self, user_ids: list[str], payload: dict):
+        # serialized once, one round trip per pipeline instead of per user
+        data = json.dumps(payload)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.publish(self.channel(user_id), data)
+            await pipe.execute()
+
+    async def publish_batches(self, batches: list[tuple[str, list[dict]]]):
+        # one message per user carrying its payloads as a list, all users in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, payloads in batches:
+                pipe.publish(self.channel(user_id), json.dumps(payloads))
+            await pipe.execute()
+
+    async def _listen(self):
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_interval)
+            if message is None or self.handler is None:
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            try:
+                data = json.loads(message["data"])
+                # a list is a batch from publish_batches
+                for payload in data if isinstance(data, list) else (data,):
+                    await self.handler(channel[len(self.prefix):], payload)
+            except Exception:
+                # one bad payload must not kill delivery for the whole worker
+                continue
+
+
+def create_broker() -> Broker:
+    url = os.getenv("WEBSOCKET_BROKER_URL")
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url, prefix=os.getenv("WEBSOCKET_BROKER_PREFIX", "ws:user:"))
+    return InMemoryBroker()
@@ -0,0 +1,69 @@
+import json
+from typing import Optional, Union
+import msgpack
+
+from .types import WEBSOCKET_REQUEST_TYPE_CODES, WEBSOCKET_TYPE_CODES
+
+Frame = Union[str, bytes]
+
+
+class Codec:
+    """
+    Wire format of one socket, picked from the client's subprotocols.
+
+    Payloads are {"type", "data"} dicts going out and {"type", "id", "data"}
+    coming in, whatever the codec.
+    """
+    subprotocol: Optional[str] = None
+
+    def encode(self, payload: dict) -> Frame:
+        raise NotImplementedError
+
+    def decode(self, frame: Frame) -> dict:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    subprotocol = "json"
+
+    def encode(self, payload: dict) -> Frame:
+        return json.dumps(payload, separators=(",", ":"))
+
+    def decode(self, frame: Frame) -> dict:
+        return json.loads(frame)
+
+
+class MsgPackCodec(Codec):
+    """
+    MessagePack frames, `[type_code, data]` out, `[type_code, data, seq]`
+    for events with a seq, and `[type_code, id, data]` in. Codes are WEBSOCKET_TYPE_CODES and WEBSOCKET_REQUEST_TYPE_CODES,
+    types without a code are sent by name.
+    """
+    subprotocol = "msgpack"
+    request_types = {code: name for name, code in WEBSOCKET_REQUEST_TYPE_CODES.items()}
+
+    def encode(self, payload: dict) -> Frame:
+        type = payload["type"]
+        frame = [WEBSOCKET_TYPE_CODES.get(type, type), payload["data"]]
+        if payload.get("seq") is not None:
+            frame.append(payload["seq"])
+        return msgpack.packb(frame)
+
+    def decode(self, frame: Frame) -> dict:
+        type, id, data = msgpack.unpackb(frame)
+        return {"type": self.request_types.get(type, type), "id": id, "data": data}
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgPackCodec()
+
+# in order of server preference
+CODECS = [MSGPACK_CODEC, JSON_CODEC]
+
+
+def negotiate_codec(subprotocols: list[str]) -> Codec:
+    """First codec the server prefers among the client's subprotocols, JSON when none match."""
+    for codec in CODECS:
+        if codec.subprotocol in subprotocols:
+            return codec
+    return JSON_CODEC
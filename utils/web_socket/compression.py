@@ -0,0 +1,121 @@
+import os
+import time
+from typing import Optional
+from uvicorn.protocols.websockets import websockets_impl
+from websockets import frames
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# permessage-deflate settings, see RFC 7692 section 7.1
+WS_DEFLATE_MIN_SIZE = int(os.getenv("WS_DEFLATE_MIN_SIZE", "256"))  # bytes, smaller frames go out uncompressed
+WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER = os.getenv("WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER", "false").lower() == "true"
+WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER = os.getenv("WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER", "false").lower() == "true"
+WS_DEFLATE_SERVER_MAX_WINDOW_BITS = _optional_int("WS_DEFLATE_SERVER_MAX_WINDOW_BITS")
+WS_DEFLATE_CLIENT_MAX_WINDOW_BITS = _optional_int("WS_DEFLATE_CLIENT_MAX_WINDOW_BITS")
+WS_DEFLATE_LEVEL = int(os.getenv("WS_DEFLATE_LEVEL", "6"))
+WS_DEFLATE_MEM_LEVEL = int(os.getenv("WS_DEFLATE_MEM_LEVEL", "8"))
+
+
+class CompressionMetrics:
+    def __init__(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "cpu_ms": round(self.cpu_seconds * 1000, 3),
+        }
+
+
+compression_metrics = CompressionMetrics()
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """
+    permessage-deflate that leaves messages under `min_size` bytes
+    uncompressed. The RFC allows it per message, the rsv1 bit tells the
+    client which ones are compressed.
+    """
+
+    def __init__(self, *args, min_size: int = WS_DEFLATE_MIN_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        self.encode_cont_data = False
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is frames.OP_CONT:
+            # continuation of a message sent uncompressed
+            if not self.encode_cont_data:
+                return frame
+        elif len(frame.data) < self.min_size:
+            compression_metrics.skipped += 1
+            self.encode_cont_data = False
+            return frame
+        else:
+            compression_metrics.compressed += 1
+            self.encode_cont_data = not frame.fin
+
+        start = time.thread_time()
+        encoded = super().encode(frame)
+        compression_metrics.cpu_seconds += time.thread_time() - start
+        compression_metrics.bytes_in += len(frame.data)
+        compression_metrics.bytes_out += len(encoded.data)
+        if frame.fin:
+            self.encode_cont_data = False
+        return encoded
+
+
+class ThresholdPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, min_size: int = WS_DEFLATE_MIN_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=self.min_size,
+        )
+
+
+def create_deflate_factory() -> ThresholdPerMessageDeflateFactory:
+    return ThresholdPerMessageDeflateFactory(
+        min_size=WS_DEFLATE_MIN_SIZE,
+        server_no_context_takeover=WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER,
+        client_no_context_takeover=WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER,
+        server_max_window_bits=WS_DEFLATE_SERVER_MAX_WINDOW_BITS,
+        client_max_window_bits=WS_DEFLATE_CLIENT_MAX_WINDOW_BITS,
+        compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL},
+    )
+
+
+class WebSocketProtocol(websockets_impl.WebSocketProtocol):
+    """
+    uvicorn's websockets protocol with the configured permessage-deflate,
+    pass it as `uvicorn.run(..., ws=WebSocketProtocol)`.
+    `ws_per_message_deflate=False` still turns compression off.
+    """
+
+    def __init__(self, config, server_state, app_state, _loop=None):
+        super().__init__(config, server_state, app_state, _loop)
+        if self.config.ws_per_message_deflate:
+            self.available_extensions = [create_deflate_factory()]
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from fastapi import WebSocket, status
+
+from .codecs import Codec, Frame, JSON_CODEC
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+
+class Connection:
+    """
+    One device's socket.
+
+    Pushes are encoded with the socket's codec and go into a bounded queue
+    drained by a dedicated writer task, so a slow client only ever backs up
+    its own queue. A full queue or a failed send closes the socket and
+    evicts it through `on_close`.
+
+    Pushes are held back until `release`, so the endpoint can first replay
+    the events the client missed while offline.
+    """
+
+    def __init__(self, user_id: str, websocket: WebSocket, codec: Codec = JSON_CODEC, max_queue: int = WS_SEND_QUEUE_SIZE):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.codec = codec
+        self.queue: asyncio.Queue[Frame] = asyncio.Queue(maxsize=max_queue)
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.close_code: Optional[int] = None
+        self.held: Optional[list[dict]] = []
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        # any inbound frame counts as a heartbeat
+        self.last_seen = time.monotonic()
+
+    def start(self, on_close: Callable[["Connection"], Awaitable[None]]):
+        self.writer = asyncio.create_task(self._write(on_close))
+
+    def send(self, payload: dict, frames: Optional[dict[Codec, Frame]] = None) -> bool:
+        # `frames` is shared by the sockets of one fan-out, each codec encodes the payload once
+        if self.closed:
+            return False
+        if self.held is not None:
+            if len(self.held) >= self.queue.maxsize:
+                self.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return False
+            self.held.append(payload)
+            return True
+        if frames is None:
+            frame = self.codec.encode(payload)
+        else:
+            frame = frames.get(self.codec)
+            if frame is None:
+                frame = frames[self.codec] = self.codec.encode(payload)
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return False
+
+    async def put(self, payload: dict) -> bool:
+        # waits for room in the queue instead of dropping the socket, for streaming replays
+        if self.closed:
+            return False
+        await self.queue.put(self.codec.encode(payload))
+        return not self.closed
+
+    def release(self, after_seq: Optional[int] = None):
+        # held events already covered by the replay are dropped
+        held, self.held = self.held or [], None
+        for payload in held:
+            seq = payload.get("seq")
+            if seq is None or after_seq is None or seq > after_seq:
+                self.send(payload)
+
+    def close(self, code: Optional[int] = None):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_code = code
+        self._drain()
+        if self.writer:
+            self.writer.cancel()
+
+    def _drain(self):
+        # unblocks a replay waiting in `put`
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def _write(self, on_close: Callable[["Connection"], Awaitable[None]]):
+        try:
+            while True:
+                frame = await self.queue.get()
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.close_code = self.close_code or status.WS_1011_INTERNAL_ERROR
+        finally:
+            self.closed = True
+            self._drain()
+            if self.close_code:
+                try:
+                    await self.websocket.close(code=self.close_code)
+                except Exception:
+                    pass
+            await on_close(self)
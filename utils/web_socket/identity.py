@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from typing import Iterable, Optional
+from cachetools import TLRUCache
+from firebase_admin import auth
+from starlette.concurrency import run_in_threadpool
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "100000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "3600"))
+IDENTITY_CACHE_NEGATIVE_TTL = float(os.getenv("IDENTITY_CACHE_NEGATIVE_TTL", "60"))
+LOOKUP_BATCH_SIZE = 100  # auth.get_users limit
+
+# cached for emails without a Firebase account
+NOT_FOUND = ""
+
+
+class _EvictionCountingCache(TLRUCache):
+    evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class IdentityCache:
+    """
+    email -> Firebase uid, LRU bounded with a TTL per entry. Keyed by the
+    lowercased email like Firebase stores it, results keep the caller's spelling.
+
+    Unknown emails are cached too, with a shorter TTL. Misses are resolved
+    in batches through auth.get_users on the threadpool. The auth utils
+    invalidate entries from worker threads, hence the lock.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = IDENTITY_CACHE_SIZE,
+        ttl: float = IDENTITY_CACHE_TTL,
+        negative_ttl: float = IDENTITY_CACHE_NEGATIVE_TTL,
+    ):
+        self.cache = _EvictionCountingCache(
+            maxsize=maxsize,
+            ttu=lambda _email, uid, now: now + (ttl if uid else negative_ttl),
+            timer=time.monotonic,
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.lookup_errors = 0
+
+    async def get(self, email: str) -> Optional[str]:
+        return (await self.get_many([email]))[email]
+
+    async def get_many(self, emails: Iterable[str]) -> dict[str, Optional[str]]:
+        found: dict[str, Optional[str]] = {}
+        missing: list[str] = []
+        for email in set(emails):
+            with self.lock:
+                uid = self.cache.get(email.lower())
+            if uid is None:
+                missing.append(email)
+            elif uid == NOT_FOUND:
+                self.negative_hits += 1
+                found[email] = None
+            else:
+                self.hits += 1
+                found[email] = uid
+
+        if missing:
+            self.misses += len(missing)
+            try:
+                resolved = await run_in_threadpool(self._lookup, missing)
+            except Exception:
+                # don't cache anything when Firebase itself failed
+                self.lookup_errors += 1
+                resolved = None
+            for email in missing:
+                uid = resolved.get(email.lower()) if resolved is not None else None
+                if resolved is not None:
+                    with self.lock:
+                        self.cache[email.lower()] = uid or NOT_FOUND
+                found[email] = uid
+        return found
+
+    def _lookup(self, emails: list[str]) -> dict[str, str]:
+        uids: dict[str, str] = {}
+        for start in range(0, len(emails), LOOKUP_BATCH_SIZE):
+            result = auth.get_users([auth.EmailIdentifier(email) for email in emails[start:start + LOOKUP_BATCH_SIZE]])
+            for user in result.users:
+                uids[user.email.lower()] = user.uid
+        return uids
+
+    def invalidate(self, email: str):
+        with self.lock:
+            self.cache.pop(email.lower(), None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            size = len(self.cache)
+        return {
+            "size": size,
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.cache.evictions,
+            "lookup_errors": self.lookup_errors,
+        }
@@ -0,0 +1,62 @@
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel
+
+class WebSocketTypes(Enum):
+    FRIEND_REQUEST_REMOVED="FRIEND_REQUEST_REMOVED"
+    FRIEND_REQUEST_SENT="FRIEND_REQUEST_SENT"
+    FRIEND_REQUEST_RECEIVED="FRIEND_REQUEST_RECEIVED"
+    FRIEND_REQUEST_ANSWER="FRIEND_REQUEST_ANSWER"
+    MESSAGE_RECEIVED="MESSAGE_RECEIVED"
+    MESSAGE_SENT="MESSAGE_SENT"
+    TYPING="TYPING"
+    READ_RECEIPT="READ_RECEIPT"
+    ACK="ACK"
+    ERROR="ERROR"
+    SYNC="SYNC"
+    PING="PING"
+    PONG="PONG"
+    GROUP_MESSAGE_RECEIVED="GROUP_MESSAGE_RECEIVED"
+
+class WebSocketRequestTypes(Enum):
+    SEND_MESSAGE="SEND_MESSAGE"
+    TYPING="TYPING"
+    READ_RECEIPT="READ_RECEIPT"
+    PING="PING"
+    PONG="PONG"
+
+class WebSocketResponse(BaseModel):
+    type: str
+    data: dict
+    seq: Optional[int] = None  # position in the user's event stream, None for transient events
+
+class WebSocketRequest(BaseModel):
+    type: WebSocketRequestTypes
+    id: Optional[str] = None  # client generated, echoed back in the ACK or ERROR
+    data: dict = {}
+
+# integer type codes used by the binary codecs, append only
+WEBSOCKET_TYPE_CODES = {
+    WebSocketTypes.FRIEND_REQUEST_REMOVED.value: 1,
+    WebSocketTypes.FRIEND_REQUEST_SENT.value: 2,
+    WebSocketTypes.FRIEND_REQUEST_RECEIVED.value: 3,
+    WebSocketTypes.FRIEND_REQUEST_ANSWER.value: 4,
+    WebSocketTypes.MESSAGE_RECEIVED.value: 5,
+    WebSocketTypes.MESSAGE_SENT.value: 6,
+    WebSocketTypes.TYPING.value: 7,
+    WebSocketTypes.READ_RECEIPT.value: 8,
+    WebSocketTypes.ACK.value: 9,
+    WebSocketTypes.ERROR.value: 10,
+    WebSocketTypes.SYNC.value: 11,
+    WebSocketTypes.PING.value: 12,
+    WebSocketTypes.PONG.value: 13,
+    WebSocketTypes.GROUP_MESSAGE_RECEIVED.value: 14,
+}
+
+WEBSOCKET_REQUEST_TYPE_CODES = {
+    WebSocketRequestTypes.SEND_MESSAGE.value: 1,
+    WebSocketRequestTypes.TYPING.value: 2,
+    WebSocketRequestTypes.READ_RECEIPT.value: 3,
+    WebSocketRequestTypes.PING.value: 4,
+    WebSocketRequestTypes.PONG.value: 5,
+}